@@ -5,11 +5,18 @@ Prompts for credentials and creates .env file
 """
 
 import os
+import re
 import sys
+import hashlib
+from functools import lru_cache
 from pathlib import Path
 from getpass import getpass
 
 
+# Matches "KEY=..." and commented-out "# KEY=..." lines in env templates
+ENV_LINE_RE = re.compile(r'^\s*#?\s*([A-Z][A-Z0-9_]*)\s*=')
+
+
 def print_header(text):
     """Print formatted header"""
     print("\n" + "=" * 70)
@@ -67,13 +74,48 @@ def prompt_input(prompt_text, default=None, required=True, secret=False):
         return value
 
 
+# Successful connection tests, keyed by a hash of the credentials used
+# (secrets themselves are never stored or logged)
+_connection_results = {}
+
+
+def _credential_key(*parts):
+    """Hash credentials into a cache key"""
+    return hashlib.blake2b("\0".join(str(p) for p in parts).encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _get_slack_sdk():
+    """Import slack_sdk once"""
+    import slack_sdk
+    return slack_sdk
+
+
+@lru_cache(maxsize=None)
+def _get_snowflake():
+    """Import snowflake.connector once"""
+    import snowflake.connector
+    return snowflake.connector
+
+
+@lru_cache(maxsize=None)
+def _get_anthropic():
+    """Import anthropic once"""
+    import anthropic
+    return anthropic
+
+
 def test_slack_connection(bot_token, app_token):
     """Test Slack connection"""
+    key = _credential_key("slack", bot_token)
+    if key in _connection_results:
+        return _connection_results[key]
+    
     try:
-        from slack_sdk import WebClient
-        client = WebClient(token=bot_token)
+        client = _get_slack_sdk().WebClient(token=bot_token)
         response = client.auth_test()
-        return True, f"✅ Connected as: {response['user']}"
+        result = _connection_results[key] = (True, f"✅ Connected as: {response['user']}")
+        return result
     except Exception as e:
         return False, f"❌ Connection failed: {str(e)}"
 
@@ -81,8 +123,6 @@ def test_slack_connection(bot_token, app_token):
 def test_snowflake_connection(config):
     """Test Snowflake connection"""
     try:
-        import snowflake.connector
-        
         conn_params = {
             "user": config["user"],
             "account": config["account"],
@@ -97,14 +137,19 @@ def test_snowflake_connection(config):
             print("⚠️  Browser auth requires interactive login - skipping connection test")
             return True, "⚠️  Browser auth configured (test manually)"
         
-        conn = snowflake.connector.connect(**conn_params)
+        key = _credential_key("snowflake", *sorted(conn_params.items()))
+        if key in _connection_results:
+            return _connection_results[key]
+        
+        conn = _get_snowflake().connect(**conn_params)
         cursor = conn.cursor()
         cursor.execute("SELECT CURRENT_VERSION()")
         version = cursor.fetchone()[0]
         cursor.close()
         conn.close()
         
-        return True, f"✅ Connected to Snowflake (version {version})"
+        result = _connection_results[key] = (True, f"✅ Connected to Snowflake (version {version})")
+        return result
     except Exception as e:
         return False, f"❌ Connection failed: {str(e)}"
 
@@ -112,8 +157,7 @@ def test_snowflake_connection(config):
 def test_anthropic_api(api_key):
     """Test Anthropic API key"""
     try:
-        import anthropic
-        client = anthropic.Anthropic(api_key=api_key)
+        client = _get_anthropic().Anthropic(api_key=api_key)
         # Just test that we can create a client
         # Don't make actual API call to avoid costs during setup
         return True, "✅ Anthropic API key format valid"
@@ -284,6 +328,13 @@ def setup_semantic():
     return config, 'env_semantic.example', 'slack_bot_semantic.py'
 
 
+@lru_cache(maxsize=None)
+def _read_template(path):
+    """Read an env template once and return its lines (newlines kept)"""
+    with open(path, 'r') as f:
+        return tuple(f)
+
+
 def write_env_file(config, template_file):
     """Write .env file from config"""
     env_path = Path('.env')
@@ -299,48 +350,33 @@ def write_env_file(config, template_file):
     # Read template (to preserve comments and structure)
     template_path = Path(template_file)
     if template_path.exists():
-        with open(template_path, 'r') as f:
-            template_content = f.read()
+        lines = list(_read_template(template_path))
+        
+        # Index the template once: first line (active or commented out) for each key
+        idx_by_key = {}
+        for i, line in enumerate(lines):
+            match = ENV_LINE_RE.match(line)
+            if match:
+                idx_by_key.setdefault(match.group(1), i)
         
-        # Replace placeholder values with actual values
-        content = template_content
+        # Replace placeholder lines with actual values (uncommenting them)
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
         for key, value in config.items():
-            # Replace various placeholder patterns
-            patterns = [
-                f"{key}=your-",
-                f"{key}=xoxb-",
-                f"{key}=xapp-",
-                f"{key}=sk-",
-                f"{key}=sk-ant-",
-                f"#{key}=",  # Commented out line
-                f"{key}=test",
-            ]
-            
-            for pattern in patterns:
-                if pattern in content:
-                    # Find the line and replace it
-                    lines = content.split('\n')
-                    for i, line in enumerate(lines):
-                        if pattern in line:
-                            # Uncomment if needed
-                            if line.strip().startswith('#'):
-                                lines[i] = line.lstrip('#').strip()
-                            # Replace value
-                            lines[i] = f"{key}={value}"
-                    content = '\n'.join(lines)
-                    break
+            i = idx_by_key.get(key)
+            if i is not None:
+                lines[i] = f"{key}={value}\n"
             else:
                 # If key not in template, append it
-                content += f"\n{key}={value}"
+                lines.append(f"{key}={value}\n")
     else:
         # No template, create from scratch
-        content = "# Generated by setup.py\n\n"
-        for key, value in config.items():
-            content += f"{key}={value}\n"
+        lines = ["# Generated by setup.py\n", "\n"]
+        lines.extend(f"{key}={value}\n" for key, value in config.items())
     
     # Write .env file
     with open(env_path, 'w') as f:
-        f.write(content)
+        f.writelines(lines)
     
     print(f"\n✅ Configuration saved to {env_path}")
     
@@ -354,18 +390,24 @@ def install_dependencies(requirements_file):
     print(f"\n📦 Installing dependencies from {requirements_file}...")
     
     import subprocess
-    try:
-        subprocess.run(
-            [sys.executable, "-m", "pip", "install", "-r", requirements_file],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print("✅ Dependencies installed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to install dependencies: {e.stderr}")
+    # Stream pip's output line by line so progress is visible and nothing is buffered
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "pip", "install", "-r", requirements_file],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
+    )
+    for line in proc.stdout:
+        print(line, end="")
+    
+    returncode = proc.wait()
+    if returncode != 0:
+        print(f"❌ Failed to install dependencies (pip exited with {returncode})")
         return False
+    
+    print("✅ Dependencies installed successfully")
+    return True
 
 
 def main():
@@ -10,13 +10,33 @@ Architecture:
 """
 
 import os
+import re
+import time
+import random
+import hashlib
 import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, Awaitable, FrozenSet, TypedDict
+import httpx
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = lambda obj: orjson.dumps(obj).decode()
+    _canonical_json = lambda obj: orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+except ImportError:  # orjson is optional - fall back to the stdlib parser
+    import json
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+    _canonical_json = lambda obj: json.dumps(obj, sort_keys=True)
+
 # Load environment variables
 load_dotenv()
 
@@ -27,14 +47,135 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _csv_set(value: Optional[str]) -> FrozenSet[str]:
+    """Parse a comma-separated env value into a set of names"""
+    return frozenset(name.strip() for name in (value or "").split(",") if name.strip())
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Bot configuration, read from the environment once at startup"""
+    
+    slack_bot_token: str
+    slack_app_token: str
+    fastmcp_server_url: str
+    fastmcp_token: str
+    llm_provider: str = "anthropic"
+    anthropic_api_key: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    # Bot user ID + tool list survive restarts here, so warm restarts skip auth_test/list_tools
+    bot_cache_path: Path = Path(".bot_cache.json")
+    # Tools whose short output is already a user-ready answer - skip the second LLM call
+    direct_return_tools: FrozenSet[str] = frozenset()
+    direct_return_max_chars: int = 512
+    # Read-only tools whose results are cached (on top of the name prefixes below)
+    idempotent_tools: FrozenSet[str] = frozenset()
+    mcp_tool_ttl: int = 300
+    # Tool results longer than this are cut before being sent back to the LLM
+    max_tool_result_chars: int = 20000
+    # Caps on in-flight LLM calls and LLM calls per second, to avoid 429 storms
+    llm_max_concurrency: int = 8
+    llm_rps: int = 10
+    
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from os.environ, failing fast on anything missing"""
+        env = os.environ
+        llm_provider = env.get("LLM_PROVIDER", "anthropic").lower()
+        
+        required = ["SLACK_BOT_TOKEN", "SLACK_APP_TOKEN", "FASTMCP_SERVER_URL", "FASTMCP_TOKEN"]
+        if llm_provider == "anthropic":
+            required.append("ANTHROPIC_API_KEY")
+        elif llm_provider == "openai":
+            required.append("OPENAI_API_KEY")
+        else:
+            raise ValueError(f"Unsupported LLM provider: {llm_provider}")
+        
+        missing = [key for key in required if not env.get(key)]
+        if missing:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+        
+        return cls(
+            slack_bot_token=env["SLACK_BOT_TOKEN"],
+            slack_app_token=env["SLACK_APP_TOKEN"],
+            fastmcp_server_url=env["FASTMCP_SERVER_URL"],
+            fastmcp_token=env["FASTMCP_TOKEN"],
+            llm_provider=llm_provider,
+            anthropic_api_key=env.get("ANTHROPIC_API_KEY"),
+            openai_api_key=env.get("OPENAI_API_KEY"),
+            bot_cache_path=Path(env.get("BOT_CACHE_PATH", ".bot_cache.json")),
+            direct_return_tools=_csv_set(env.get("DIRECT_RETURN_TOOLS")),
+            direct_return_max_chars=int(env.get("DIRECT_RETURN_MAX_CHARS", "512")),
+            idempotent_tools=_csv_set(env.get("IDEMPOTENT_TOOLS")),
+            mcp_tool_ttl=int(env.get("MCP_TOOL_TTL", "300")),
+            max_tool_result_chars=int(env.get("MAX_TOOL_RESULT_CHARS", "20000")),
+            llm_max_concurrency=int(env.get("LLM_MAX_CONCURRENCY", "8")),
+            llm_rps=int(env.get("LLM_RPS", "10"))
+        )
+
+
+SETTINGS = Settings.from_env()
+
 # Initialize Slack app
-slack_app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
+slack_app = AsyncApp(token=SETTINGS.slack_bot_token)
+
+# Shared HTTP client for the LLM SDKs - keeps TLS connections alive (HTTP/2)
+# between calls instead of paying a handshake on every request
+_HTTPX = httpx.AsyncClient(
+    http2=True,
+    timeout=60,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=120)
+)
+
+# Smooth bursts of Slack traffic before they reach the LLM provider
+_LLM_SEM = asyncio.Semaphore(SETTINGS.llm_max_concurrency)
+_LLM_RL = AsyncLimiter(max_rate=SETTINGS.llm_rps, time_period=1)
+
+# How long the MCP tool list is reused before asking the server again
+TOOLS_CACHE_TTL = 600
+
+# How long the on-disk startup cache (SETTINGS.bot_cache_path) stays fresh
+BOT_CACHE_TTL = 3600
+
+# Tool name prefixes treated as read-only (cacheable)
+IDEMPOTENT_TOOL_PREFIXES = ("get_", "list_", "query_")
+
+def _is_retryable(exc: Exception) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying.
+    Auth failures (401/403) and other client errors are not, and neither are
+    timeouts: a slow generation re-sent would stall and bill the same work again."""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    cause = exc if isinstance(exc, httpx.TransportError) else exc.__cause__
+    return isinstance(cause, httpx.TransportError) and not isinstance(cause, httpx.TimeoutException)
+
+
+async def _with_retry(fn: Callable[[], Awaitable[Any]], *, retries: int = 6, base: float = 0.25) -> Any:
+    """Call fn, retrying transient failures with jittered exponential backoff"""
+    for attempt in range(retries):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == retries - 1 or not _is_retryable(e):
+                raise
+            delay = base * 2 ** attempt + random.random() * base
+            logger.warning(f"Transient error ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class LLMResult(TypedDict, total=False):
+    """Normalized LLM response - API failures set 'error' instead of raising"""
+    content: str
+    tool_calls: List[Dict]
+    error: str
 
 
 class LLMProvider:
     """Base class for LLM providers - implement this for your LLM of choice"""
     
-    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
+    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> LLMResult:
         """
         Send a chat request to your LLM
         
@@ -43,9 +184,20 @@ class LLMProvider:
             tools: Available tools in OpenAI format (optional)
         
         Returns:
-            Response dict with 'content' and optional 'tool_calls'
+            LLMResult with 'content' and optional 'tool_calls', or 'error'
+            if the API call failed
         """
         raise NotImplementedError("Implement this method for your LLM")
+    
+    async def warmup(self):
+        """Prime the shared connection pool with a cheap request to the API host"""
+        client = getattr(self, "client", None)
+        if client is None or not hasattr(client, "base_url"):
+            return
+        try:
+            await _HTTPX.head(str(client.base_url))
+        except httpx.HTTPError as e:
+            logger.warning(f"LLM warmup failed: {e}")
 
 
 class AnthropicProvider(LLMProvider):
@@ -53,9 +205,9 @@ class AnthropicProvider(LLMProvider):
     
     def __init__(self, api_key: str):
         from anthropic import AsyncAnthropic
-        self.client = AsyncAnthropic(api_key=api_key)
+        self.client = AsyncAnthropic(api_key=api_key, http_client=_HTTPX, max_retries=0)
     
-    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
+    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> LLMResult:
         """Call Claude API"""
         try:
             # Convert to Anthropic format
@@ -74,27 +226,33 @@ class AnthropicProvider(LLMProvider):
             if tools:
                 kwargs["tools"] = tools
             
-            response = await self.client.messages.create(**kwargs)
+            async def create():
+                async with _LLM_SEM, _LLM_RL:
+                    return await self.client.messages.create(**kwargs)
             
-            # Convert response
-            if response.stop_reason == "tool_use":
-                tool_calls = [
-                    {
+            response = await _with_retry(create)
+            
+            # Convert response in a single pass over the content blocks
+            text_parts = []
+            tool_calls = []
+            for block in response.content:
+                if block.type == "text":
+                    text_parts.append(block.text)
+                elif block.type == "tool_use":
+                    tool_calls.append({
                         "id": block.id,
                         "name": block.name,
                         "arguments": block.input
-                    }
-                    for block in response.content if block.type == "tool_use"
-                ]
-                text = next((block.text for block in response.content if block.type == "text"), "")
-                return {"content": text, "tool_calls": tool_calls}
-            else:
-                text = next((block.text for block in response.content if block.type == "text"), "")
-                return {"content": text}
+                    })
+            
+            result = {"content": "".join(text_parts)}
+            if tool_calls:
+                result["tool_calls"] = tool_calls
+            return result
                 
         except Exception as e:
             logger.error(f"Anthropic API error: {e}")
-            return {"content": f"Error: {str(e)}"}
+            return {"content": "", "error": str(e)}
 
 
 class OpenAIProvider(LLMProvider):
@@ -102,9 +260,9 @@ class OpenAIProvider(LLMProvider):
     
     def __init__(self, api_key: str):
         from openai import AsyncOpenAI
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key, http_client=_HTTPX, max_retries=0)
     
-    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
+    async def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> LLMResult:
         """Call OpenAI API"""
         try:
             kwargs = {
@@ -116,7 +274,11 @@ class OpenAIProvider(LLMProvider):
                 kwargs["tools"] = tools
                 kwargs["tool_choice"] = "auto"
             
-            response = await self.client.chat.completions.create(**kwargs)
+            async def create():
+                async with _LLM_SEM, _LLM_RL:
+                    return await self.client.chat.completions.create(**kwargs)
+            
+            response = await _with_retry(create)
             message = response.choices[0].message
             
             result = {"content": message.content or ""}
@@ -135,7 +297,7 @@ class OpenAIProvider(LLMProvider):
             
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            return {"content": f"Error: {str(e)}"}
+            return {"content": "", "error": str(e)}
 
 
 class FastMCPClient:
@@ -144,13 +306,81 @@ class FastMCPClient:
     def __init__(self, server_url: str, token: str):
         from fastmcp import Client
         from fastmcp.client.auth import BearerAuth
+        from fastmcp.exceptions import ToolError
+        self._tool_error = ToolError
+        self.server_url = server_url
+        self.token = token
         self.client = Client(server_url, auth=BearerAuth(token=token))
+        self._session = None
+        self._session_lock = asyncio.Lock()  # serializes opening/closing the session
+        self._tools_cache: Optional[List[Dict]] = None
+        self._tools_expiry = 0.0
+        self._tools_lock = asyncio.Lock()
+        self._result_cache = TTLCache(maxsize=512, ttl=SETTINGS.mcp_tool_ttl)
+    
+    async def connect(self):
+        """Open one long-lived MCP session, reused by every tool call"""
+        async with self._session_lock:
+            if self._session is None:
+                self._session = await self.client.__aenter__()
+                logger.info(f"Connected to MCP server at {self.server_url}")
+            return self._session
     
-    async def get_tools(self) -> List[Dict]:
-        """Get available tools from MCP server in OpenAI format"""
+    async def close(self):
+        """Close the MCP session"""
+        async with self._session_lock:
+            if self._session is not None:
+                self._session = None
+                await self.client.__aexit__(None, None, None)
+    
+    async def _drop_session(self, failed):
+        """Close a session that errored, unless another call already replaced it"""
+        async with self._session_lock:
+            if self._session is not failed:
+                return
+            self._session = None
+            try:
+                await self.client.__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error closing MCP session: {e}")
+    
+    async def _with_session(self, op: Callable[[Any], Awaitable[Any]], retry: bool = True) -> Any:
+        """Run op(session), reopening the MCP session once if it has dropped
+        
+        With retry=False the session is still reopened for the next call, but
+        op is not run again.
+        """
+        session = await self.connect()
         try:
-            async with self.client as client:
-                tools_list = await client.list_tools()
+            return await op(session)
+        except self._tool_error:
+            raise  # the tool itself failed; the session is fine
+        except Exception as e:
+            logger.warning(f"MCP session error ({e}), reconnecting")
+            await self._drop_session(session)
+            if not retry:
+                raise
+            return await op(await self.connect())
+    
+    def seed_tools(self, tools: List[Dict]):
+        """Prime the tool cache (e.g. from the on-disk startup cache)"""
+        self._tools_cache = tools
+        self._tools_expiry = time.monotonic() + TOOLS_CACHE_TTL
+    
+    async def get_tools(self, refresh: bool = False) -> List[Dict]:
+        """
+        Get available tools from MCP server in OpenAI format
+        
+        The converted list is cached for TOOLS_CACHE_TTL seconds; pass
+        refresh=True to force a new list_tools round-trip.
+        """
+        async with self._tools_lock:
+            fresh = time.monotonic() < self._tools_expiry
+            if self._tools_cache is not None and fresh and not refresh:
+                return self._tools_cache
+            
+            try:
+                tools_list = await self._with_session(lambda session: session.list_tools())
                 
                 # Convert to OpenAI tool format
                 openai_tools = []
@@ -164,22 +394,56 @@ class FastMCPClient:
                         }
                     })
                 
+                self._tools_cache = openai_tools
+                self._tools_expiry = time.monotonic() + TOOLS_CACHE_TTL
                 return openai_tools
-        except Exception as e:
-            logger.error(f"Failed to get tools: {e}")
-            return []
+            except Exception as e:
+                logger.error(f"Failed to get tools: {e}")
+                return self._tools_cache or []
+    
+    @staticmethod
+    def is_idempotent(tool_name: str) -> bool:
+        """Whether a tool is read-only, so its results can be cached"""
+        return tool_name in SETTINGS.idempotent_tools or tool_name.startswith(IDEMPOTENT_TOOL_PREFIXES)
+    
+    def clear_cache(self) -> int:
+        """Drop all cached tool results, returning how many were cached"""
+        count = len(self._result_cache)
+        self._result_cache.clear()
+        return count
     
     async def call_tool(self, tool_name: str, arguments: Dict) -> str:
-        """Call a tool on the MCP server"""
+        """Call a tool on the MCP server (read-only tools are cached)"""
+        cacheable = self.is_idempotent(tool_name)
+        if cacheable:
+            key = (tool_name, _canonical_json(arguments))
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                logger.info(f"Tool cache hit: {tool_name}")
+                return cached
+        
         try:
-            async with self.client as client:
-                result = await client.call_tool(tool_name, arguments)
-                
-                # Extract text content
-                if hasattr(result, 'content') and result.content:
-                    return result.content[0].text
-                return str(result)
-                
+            # Only read-only tools are retried; a tool with side effects could
+            # otherwise run twice
+            if cacheable:
+                result = await self._with_session(
+                    lambda session: _with_retry(lambda: session.call_tool(tool_name, arguments))
+                )
+            else:
+                result = await self._with_session(
+                    lambda session: session.call_tool(tool_name, arguments), retry=False
+                )
+            
+            # Extract text content
+            if hasattr(result, 'content') and result.content:
+                text = result.content[0].text
+            else:
+                text = str(result)
+            
+            if cacheable:
+                self._result_cache[key] = text
+            return text
+            
         except Exception as e:
             logger.error(f"Tool call failed: {e}")
             return f"Error calling {tool_name}: {str(e)}"
@@ -193,22 +457,87 @@ class SlackBot:
         self.mcp = mcp
         self.bot_user_id = None
         self.tools_cache = None
+        self._mention_re = None
     
     async def initialize(self):
         """Initialize bot"""
         try:
-            # Get bot user ID
-            auth_response = await slack_app.client.auth_test()
-            self.bot_user_id = auth_response["user_id"]
+            cached = self._load_startup_cache()
+            if cached:
+                self.bot_user_id = cached["uid"]
+                self.tools_cache = cached["tools"]
+                self.mcp.seed_tools(self.tools_cache)
+                logger.info("✓ Loaded bot user ID and tools from startup cache")
+            else:
+                # Get bot user ID
+                try:
+                    auth_response = await slack_app.client.auth_test()
+                except Exception:
+                    SETTINGS.bot_cache_path.unlink(missing_ok=True)
+                    raise
+                self.bot_user_id = auth_response["user_id"]
             
-            # Cache available tools
-            self.tools_cache = await self.mcp.get_tools()
+            # Matches <@BOTID> and <@BOTID|name> mentions
+            self._mention_re = re.compile(rf"<@{re.escape(self.bot_user_id)}(?:\|[^>]+)?>")
+            
+            # Open the MCP session once and cache available tools
+            await self.mcp.connect()
+            if not cached:
+                self.tools_cache = await self.mcp.get_tools()
+                self._save_startup_cache()
+            
+            # Warm the LLM connection pool
+            await self.llm.warmup()
             
             logger.info(f"✓ Bot initialized with {len(self.tools_cache)} tools")
         except Exception as e:
             logger.error(f"Initialization failed: {e}")
             raise
     
+    def _startup_cache_key(self) -> str:
+        """Cache entries are only valid for the same Slack token and MCP server"""
+        raw = f"{SETTINGS.slack_bot_token}|{self.mcp.server_url}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    def _load_startup_cache(self) -> Optional[Dict]:
+        """Return cached startup data if present and fresh"""
+        try:
+            data = _json_loads(SETTINGS.bot_cache_path.read_bytes())
+        except (OSError, ValueError):
+            return None
+        
+        if data.get("key") != self._startup_cache_key():
+            return None
+        if time.time() - data.get("ts", 0) >= BOT_CACHE_TTL:
+            return None
+        return data
+    
+    def _save_startup_cache(self):
+        """Atomically write bot user ID + tools to the startup cache"""
+        if not self.tools_cache:
+            return
+        
+        data = {
+            "ts": time.time(),
+            "key": self._startup_cache_key(),
+            "uid": self.bot_user_id,
+            "tools": self.tools_cache
+        }
+        tmp_path = SETTINGS.bot_cache_path.with_name(SETTINGS.bot_cache_path.name + ".tmp")
+        try:
+            tmp_path.write_text(_json_dumps(data))
+            os.replace(tmp_path, SETTINGS.bot_cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write startup cache: {e}")
+    
+    @staticmethod
+    def _truncate_tool_result(text: str) -> str:
+        """Cap tool output so huge results aren't shipped through the LLM in full"""
+        limit = SETTINGS.max_tool_result_chars
+        if len(text) <= limit:
+            return text
+        return f"{text[:limit]}\n\n[truncated {len(text) - limit} of {len(text)} characters]"
+    
     async def process_query(self, query: str, channel_id: str, thread_id: str) -> str:
         """Process a user query using LLM + MCP tools"""
         try:
@@ -224,32 +553,54 @@ class SlackBot:
                 }
             ]
             
+            # Tool list is cached by the MCP client; this only refetches after the TTL
+            self.tools_cache = await self.mcp.get_tools()
+            
             # First LLM call (may include tool calls)
             logger.info(f"Sending query to LLM...")
             llm_response = await self.llm.chat(messages, tools=self.tools_cache)
+            if llm_response.get("error"):
+                return f"❌ Error: {llm_response['error']}"
             
             # Handle tool calls
             if llm_response.get("tool_calls"):
                 logger.info(f"LLM requested {len(llm_response['tool_calls'])} tool calls")
                 
-                # Execute each tool call
-                for tool_call in llm_response["tool_calls"]:
-                    tool_name = tool_call["name"]
+                # Parse arguments up front (OpenAI sends JSON strings)
+                tool_calls = llm_response["tool_calls"]
+                parsed_args = []
+                for tool_call in tool_calls:
                     tool_args = tool_call["arguments"]
-                    
-                    if isinstance(tool_args, str):
-                        import json
-                        tool_args = json.loads(tool_args)
-                    
-                    logger.info(f"Calling tool: {tool_name}")
-                    tool_result = await self.mcp.call_tool(tool_name, tool_args)
-                    
-                    # Add to conversation
-                    messages.append({
-                        "role": "assistant",
-                        "content": llm_response.get("content", ""),
-                        "tool_calls": llm_response["tool_calls"]
-                    })
+                    if isinstance(tool_args, (str, bytes)):
+                        tool_args = _json_loads(tool_args)
+                    parsed_args.append(tool_args)
+                
+                # Execute all tool calls concurrently
+                logger.info(f"Calling tools: {[tc['name'] for tc in tool_calls]}")
+                results = await asyncio.gather(
+                    *[self.mcp.call_tool(tc["name"], args) for tc, args in zip(tool_calls, parsed_args)],
+                    return_exceptions=True
+                )
+                
+                # A single short result from a direct-return tool is the answer as-is
+                if len(tool_calls) == 1 and tool_calls[0]["name"] in SETTINGS.direct_return_tools:
+                    tool_result = results[0]
+                    if (isinstance(tool_result, str)
+                            and not tool_result.startswith("Error")
+                            and len(tool_result) <= SETTINGS.direct_return_max_chars):
+                        logger.info(f"Returning {tool_calls[0]['name']} result directly")
+                        return f"{llm_response.get('content', '')}\n\n{tool_result}".strip()
+                
+                # Add to conversation: one assistant turn, then one result per call
+                messages.append({
+                    "role": "assistant",
+                    "content": llm_response.get("content", ""),
+                    "tool_calls": tool_calls
+                })
+                for tool_call, tool_result in zip(tool_calls, results):
+                    if isinstance(tool_result, Exception):
+                        tool_result = f"Error: {tool_result}"
+                    tool_result = self._truncate_tool_result(tool_result)
                     messages.append({
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
@@ -259,6 +610,8 @@ class SlackBot:
                 # Second LLM call with tool results
                 logger.info("Sending tool results back to LLM...")
                 final_response = await self.llm.chat(messages)
+                if final_response.get("error"):
+                    return f"❌ Error: {final_response['error']}"
                 return final_response["content"]
             
             # No tools needed - return LLM response
@@ -270,23 +623,36 @@ class SlackBot:
 
 
 # Initialize components
-llm_provider_type = os.environ.get("LLM_PROVIDER", "anthropic").lower()
-
-if llm_provider_type == "anthropic":
-    llm = AnthropicProvider(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-elif llm_provider_type == "openai":
-    llm = OpenAIProvider(api_key=os.environ.get("OPENAI_API_KEY"))
+if SETTINGS.llm_provider == "anthropic":
+    llm = AnthropicProvider(api_key=SETTINGS.anthropic_api_key)
 else:
-    raise ValueError(f"Unsupported LLM provider: {llm_provider_type}")
+    llm = OpenAIProvider(api_key=SETTINGS.openai_api_key)
 
 mcp = FastMCPClient(
-    server_url=os.environ.get("FASTMCP_SERVER_URL"),
-    token=os.environ.get("FASTMCP_TOKEN")
+    server_url=SETTINGS.fastmcp_server_url,
+    token=SETTINGS.fastmcp_token
 )
 
 bot = SlackBot(llm=llm, mcp=mcp)
 
 
+async def reply_in_place(text: str, channel_id: str, thread_id: str):
+    """Post a placeholder, then edit it into the answer once it's ready"""
+    placeholder = await slack_app.client.chat_postMessage(
+        channel=channel_id,
+        thread_ts=thread_id,
+        text="🤔 Processing..."
+    )
+    
+    response = await bot.process_query(text, channel_id, thread_id)
+    
+    await slack_app.client.chat_update(
+        channel=channel_id,
+        ts=placeholder["ts"],
+        text=response
+    )
+
+
 @slack_app.event("app_mention")
 async def handle_mention(event, say):
     """Handle @mentions"""
@@ -297,8 +663,8 @@ async def handle_mention(event, say):
         text = event.get("text", "")
         
         # Remove bot mention
-        if bot.bot_user_id:
-            text = text.replace(f"<@{bot.bot_user_id}>", "").strip()
+        if bot._mention_re:
+            text = bot._mention_re.sub("", text).strip()
         
         if not text:
             await say(
@@ -309,14 +675,8 @@ async def handle_mention(event, say):
         
         logger.info(f"Query from {user_id}: {text}")
         
-        # Send thinking message
-        await say(text="🤔 Processing...", thread_ts=thread_id)
-        
-        # Process query
-        response = await bot.process_query(text, channel_id, thread_id)
-        
-        # Send response
-        await say(text=response, thread_ts=thread_id)
+        # Process query, replacing the thinking message with the response
+        await reply_in_place(text, channel_id, thread_id)
         
     except Exception as e:
         logger.error(f"Error: {e}", exc_info=True)
@@ -335,12 +695,17 @@ async def handle_message(event, say):
         if text:
             logger.info(f"DM from {user_id}: {text}")
             
-            # Send thinking message
-            await say(text="🤔 Processing...", thread_ts=thread_id)
-            
             # Process
-            response = await bot.process_query(text, channel_id, thread_id)
-            await say(text=response, thread_ts=thread_id)
+            await reply_in_place(text, channel_id, thread_id)
+
+
+@slack_app.command("/bot-cache-clear")
+async def handle_cache_clear_command(ack, say):
+    """Slash command to drop cached tool results"""
+    await ack()
+    
+    cleared = mcp.clear_cache()
+    await say(f"🧹 Cleared {cleared} cached tool result(s)")
 
 
 async def main():
@@ -351,15 +716,19 @@ async def main():
     # Initialize
     await bot.initialize()
     
-    logger.info(f"✓ LLM Provider: {llm_provider_type}")
+    logger.info(f"✓ LLM Provider: {SETTINGS.llm_provider}")
     logger.info(f"✓ Bot User ID: {bot.bot_user_id}")
     logger.info(f"✓ Available Tools: {len(bot.tools_cache)}")
     logger.info("✓ Ready!")
     logger.info("=" * 60)
     
     # Start
-    handler = AsyncSocketModeHandler(slack_app, os.environ.get("SLACK_APP_TOKEN"))
-    await handler.start_async()
+    handler = AsyncSocketModeHandler(slack_app, SETTINGS.slack_app_token)
+    try:
+        await handler.start_async()
+    finally:
+        await mcp.close()
+        await _HTTPX.aclose()
 
 
 if __name__ == "__main__":
@@ -11,13 +11,31 @@ Architecture:
 """
 
 import os
+import re
+import time
+import hashlib
 import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from itertools import groupby
+from pathlib import Path
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 import snowflake.connector
-from typing import Dict, List
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 import asyncio
-import json
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = lambda obj: orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:  # orjson is optional - fall back to the stdlib parser
+    import json
+    _json_loads = json.loads
+    _json_dumps = lambda obj: json.dumps(obj, default=str)
 
 # Configure logging
 logging.basicConfig(
@@ -29,10 +47,188 @@ logger = logging.getLogger(__name__)
 # Initialize Slack app
 slack_app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
 
+# Questions starting with this prefix skip the semantic cache
+NO_CACHE_PREFIX = "no_cache:"
+
+# Results are capped at MAX_RESULT_ROWS; one extra row is fetched only to detect
+# truncation. Only the first PROMPT_SAMPLE_ROWS rows go into the Cortex prompt;
+# larger results add min/max/sum/avg for each numeric column instead.
+MAX_RESULT_ROWS = 100
+PROMPT_SAMPLE_ROWS = 20
+
+# Schema descriptions are cached here between restarts
+SCHEMA_CACHE_DIR = Path.home() / ".cache" / "sllmbot"
+
+# SQL safety check: comments are stripped first so "/*x*/drop" can't hide a keyword,
+# then a single alternation scans for any write/DDL keyword in one pass
+SQL_COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+DANGEROUS_SQL_RE = re.compile(
+    r"\b(?:drop|delete|truncate|insert|update|merge|alter|create|grant|revoke|exec(?:ute)?|call)\b",
+    re.IGNORECASE
+)
+
+
+class SemanticCache:
+    """
+    Answers to previous questions, looked up by embedding similarity
+    
+    Embeddings are L2-normalized, so cosine similarity is a single matrix-vector
+    product over all cached questions. Each answer is tagged with the model and
+    schema hash it was produced with and only matches while both are current.
+    Entries are persisted to sqlite so the cache survives restarts.
+    """
+    
+    def __init__(self, path: str, threshold: float = 0.92, ttl: int = 3600):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Caches written before answers were versioned can't be trusted; start over
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(answers)")}
+        if columns and "schema_sha1" not in columns:
+            self._db.execute("DROP TABLE answers")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                question TEXT,
+                embedding BLOB,
+                result TEXT,
+                model TEXT,
+                schema_sha1 TEXT,
+                created_at REAL
+            )
+        """)
+        self._db.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl,))
+        self._db.commit()
+        
+        rows = self._db.execute(
+            "SELECT rowid, question, embedding, result, model, schema_sha1, created_at FROM answers ORDER BY created_at"
+        ).fetchall()
+        self.vecs = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows]) if rows else None
+        self.created_at = np.array([r[6] for r in rows], dtype=np.float64)
+        self.row_ids = [r[0] for r in rows]
+        self.versions = [(r[4], r[5]) for r in rows]
+        self.entries = [(r[1], _json_loads(r[3])) for r in rows]
+        logger.info(f"Semantic cache loaded: {len(self.entries)} answers")
+    
+    @staticmethod
+    def normalize(vec) -> np.ndarray:
+        """Convert an embedding to a unit-length float32 vector"""
+        vec = np.asarray(vec, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) or 1.0)
+    
+    def _scores(self, vec: np.ndarray, model: str, schema_sha1: str) -> np.ndarray:
+        """Similarity to every entry; -1 for entries from another model or schema"""
+        scores = self.vecs @ vec
+        current = np.array([v == (model, schema_sha1) for v in self.versions], dtype=bool)
+        scores[~current] = -1.0
+        return scores
+    
+    def lookup(self, vec: np.ndarray, model: str, schema_sha1: str) -> Optional[Dict]:
+        """Return the cached result for the most similar fresh question, if close enough"""
+        with self._lock:
+            if self.vecs is None or not len(self.vecs):
+                return None
+            
+            scores = self._scores(vec, model, schema_sha1)
+            scores[self.created_at < time.time() - self.ttl] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            
+            question, result = self.entries[best]
+            logger.info(f"Semantic cache hit ({scores[best]:.3f}): {question}")
+            return result
+    
+    def add(self, question: str, vec: np.ndarray, result: Dict, model: str, schema_sha1: str):
+        """Store an answer, replacing any it would match and dropping expired entries"""
+        now = time.time()
+        # Round-trip through JSON so cached results look the same after a restart
+        payload = _json_dumps(result)
+        
+        with self._lock:
+            stale = []
+            if self.vecs is not None and len(self.vecs):
+                keep = (self.created_at >= now - self.ttl) & (self._scores(vec, model, schema_sha1) < self.threshold)
+                stale = [row_id for row_id, k in zip(self.row_ids, keep) if not k]
+                self.vecs = self.vecs[keep]
+                self.created_at = self.created_at[keep]
+                self.row_ids = [r for r, k in zip(self.row_ids, keep) if k]
+                self.versions = [v for v, k in zip(self.versions, keep) if k]
+                self.entries = [e for e, k in zip(self.entries, keep) if k]
+            
+            self._db.executemany("DELETE FROM answers WHERE rowid = ?", [(row_id,) for row_id in stale])
+            cur = self._db.execute(
+                "INSERT INTO answers (question, embedding, result, model, schema_sha1, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (question, vec.tobytes(), payload, model, schema_sha1, now)
+            )
+            self._db.commit()
+            
+            self.vecs = vec[None, :] if self.vecs is None or not len(self.vecs) else np.vstack([self.vecs, vec])
+            self.created_at = np.append(self.created_at, now)
+            self.row_ids.append(cur.lastrowid)
+            self.versions.append((model, schema_sha1))
+            self.entries.append((question, _json_loads(payload)))
+
+
+class GeneratedSqlCache:
+    """
+    Cortex-generated SQL for exact repeats of a question
+    
+    Keyed by model + question text; an entry is only reused while the schema it
+    was generated against is unchanged.
+    """
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS q_sql ("
+            "question_sha1 TEXT PRIMARY KEY, sql TEXT, model TEXT, schema_sha1 TEXT, created_at INTEGER)"
+        )
+        self._db.commit()
+    
+    @staticmethod
+    def key(model: str, question: str) -> str:
+        """Cache key for a question asked of a given model"""
+        return hashlib.sha1(f"{model}|{question.strip()}".encode()).hexdigest()
+    
+    def get(self, key: str, schema_sha1: str) -> Optional[str]:
+        """Return the stored SQL for this question if it matches the current schema"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sql FROM q_sql WHERE question_sha1 = ? AND schema_sha1 = ?",
+                (key, schema_sha1)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def put(self, key: str, sql: str, model: str, schema_sha1: str):
+        """Store SQL that executed successfully"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO q_sql (question_sha1, sql, model, schema_sha1, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, sql, model, schema_sha1, int(time.time()))
+            )
+            self._db.commit()
+
 
 class SnowflakeCortexProvider:
     """Snowflake Cortex integration for text-to-SQL"""
     
+    # Fixed statement texts. Connections use qmark (server-side) binding, so the
+    # text Snowflake sees never changes and only the bind values differ.
+    SCHEMA_STMT = """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = ?
+        ORDER BY table_name, ordinal_position
+    """
+    EMBED_STMT = "SELECT SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, ?)"
+    SQL_GEN_STMT = "SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS generated_sql"
+    ANSWER_STMT = "SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS formatted_answer"
+    
     def __init__(self):
         self.account = os.environ.get("SNOWFLAKE_ACCOUNT")
         self.user = os.environ.get("SNOWFLAKE_USER")
@@ -41,68 +237,255 @@ class SnowflakeCortexProvider:
         self.database = os.environ.get("SNOWFLAKE_DATABASE", "ANALYTICS")
         self.schema = os.environ.get("SNOWFLAKE_SCHEMA", "ANALYTICS")
         self.model = os.environ.get("CORTEX_MODEL", "mistral-large")  # or llama3-70b, etc.
+        self.embed_model = os.environ.get("CORTEX_EMBED_MODEL", "e5-base-v2")
+        
+        self.cache = None
+        if os.environ.get("SEMANTIC_CACHE", "true").lower() == "true":
+            self.cache = SemanticCache(
+                path=os.environ.get("SEMANTIC_CACHE_PATH", ".cortex_cache.sqlite"),
+                threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+                ttl=int(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+            )
+        
+        self.sql_cache = None
+        if os.environ.get("SQL_CACHE", "true").lower() == "true":
+            self.sql_cache = GeneratedSqlCache(
+                path=os.environ.get("SEMANTIC_CACHE_PATH", ".cortex_cache.sqlite")
+            )
+        
+        # Connection pool: connections are opened on demand up to pool_size and
+        # reused across questions (keep-alive avoids re-authenticating)
+        self.pool_size = int(os.environ.get("SNOWFLAKE_POOL_SIZE", "8"))
+        self.pool_timeout = 120
+        self._pool: asyncio.Queue = asyncio.Queue()
+        self._connections: List = []
+        self._opening = 0
+        
+        # Identical questions currently being answered, keyed by normalized-question hash
+        self._inflight: Dict[str, asyncio.Task] = {}
         
-        self.conn = None
-        self._connect()
+        conn = self._connect()
         
-        # Get schema information on startup
-        self.schema_info = self._get_schema_info()
-        logger.info(f"Connected to Snowflake. Schema info loaded: {len(self.schema_info)} tables")
+        # Get schema information on startup (from the disk cache when fresh)
+        self.schema_ttl = int(os.environ.get("SCHEMA_CACHE_TTL", "3600"))
+        self.schema_info = self._load_or_refresh_schema(conn, ttl=self.schema_ttl)
+        logger.info(f"Connected to Snowflake. Schema info loaded: {len(self.schema_info.splitlines())} tables")
+        self._pool.put_nowait(conn)
     
     def _connect(self):
-        """Establish Snowflake connection"""
+        """Establish a Snowflake connection and register it with the pool"""
         try:
-            self.conn = snowflake.connector.connect(
+            conn = snowflake.connector.connect(
                 account=self.account,
                 user=self.user,
                 password=self.password,
                 warehouse=self.warehouse,
                 database=self.database,
-                schema=self.schema
+                schema=self.schema,
+                client_session_keep_alive=True,
+                paramstyle="qmark"
             )
-            logger.info("Snowflake connection established")
+            self._connections.append(conn)
+            logger.info(f"Snowflake connection established ({len(self._connections)}/{self.pool_size})")
+            return conn
         except Exception as e:
             logger.error(f"Failed to connect to Snowflake: {e}")
             raise
     
-    def _get_schema_info(self) -> str:
-        """Get schema information for all tables"""
-        cursor = self.conn.cursor()
+    async def _acquire(self):
+        """Take a connection from the pool, opening a new one if below pool_size"""
+        if self._pool.empty() and self._opening + len(self._connections) < self.pool_size:
+            self._opening += 1
+            try:
+                return await asyncio.to_thread(self._connect)
+            finally:
+                self._opening -= 1
+        return await asyncio.wait_for(self._pool.get(), timeout=self.pool_timeout)
+    
+    def _release(self, conn):
+        """Return a connection to the pool"""
+        self._pool.put_nowait(conn)
+    
+    def _discard(self, conn):
+        """Drop a broken connection so the pool can open a replacement"""
+        if conn in self._connections:
+            self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    @staticmethod
+    def _fetchone(cursor, sql: str, params=None):
+        """Execute a statement and fetch its first row (blocking)"""
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+    
+    @staticmethod
+    async def _await_query(conn, cursor, sfqid: str, poll_interval: float = 0.1):
+        """Wait for an execute_async statement to finish, then fetch its first row"""
+        while conn.is_still_running(
+            await asyncio.to_thread(conn.get_query_status_throw_if_error, sfqid)
+        ):
+            await asyncio.sleep(poll_interval)
         
-        # Get all tables
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = %s
-        """, (self.schema,))
+        def fetch():
+            cursor.get_results_from_sfqid(sfqid)
+            return cursor.fetchone()
         
-        tables = [row[0] for row in cursor.fetchall()]
+        return await asyncio.to_thread(fetch)
+    
+    def _get_schema_info(self, conn) -> str:
+        """Get schema information for all tables in one round-trip"""
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(self.SCHEMA_STMT, (self.schema,))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
         
         schema_parts = []
-        for table in tables:
-            # Get columns for each table
-            cursor.execute("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_schema = %s AND table_name = %s
-                ORDER BY ordinal_position
-            """, (self.schema, table))
-            
-            columns = cursor.fetchall()
-            col_desc = ", ".join([f"{col[0]} ({col[1]})" for col in columns])
+        for table, columns in groupby(rows, key=lambda row: row[0]):
+            col_desc = ", ".join([f"{col[1]} ({col[2]})" for col in columns])
             schema_parts.append(f"{table}: {col_desc}")
         
         return "\n".join(schema_parts)
     
-    def query_with_cortex(self, user_question: str) -> Dict:
+    def _schema_cache_path(self) -> Path:
+        """Cache file for this account/database/schema"""
+        key = hashlib.sha256(f"{self.account}|{self.database}|{self.schema}".encode()).hexdigest()[:16]
+        return SCHEMA_CACHE_DIR / f"schema_{key}.json"
+    
+    def _load_or_refresh_schema(self, conn, ttl: int) -> str:
+        """Return cached schema info if younger than ttl, otherwise query Snowflake"""
+        try:
+            data = _json_loads(self._schema_cache_path().read_text())
+            if time.time() - data["fetched_at"] < ttl:
+                logger.info("Schema info loaded from disk cache")
+                return data["schema"]
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        return self._refresh_schema(conn)
+    
+    def _refresh_schema(self, conn) -> str:
+        """Query schema info from Snowflake and write it to the disk cache"""
+        schema_info = self._get_schema_info(conn)
+        self.schema_info = schema_info
+        
+        path = self._schema_cache_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_text(_json_dumps({"fetched_at": time.time(), "schema": schema_info}))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write schema cache: {e}")
+        
+        return schema_info
+    
+    async def refresh_schema_periodically(self):
+        """Background task: refresh schema info every schema_ttl seconds"""
+        while True:
+            await asyncio.sleep(self.schema_ttl)
+            try:
+                conn = await self._acquire()
+                try:
+                    await asyncio.to_thread(self._refresh_schema, conn)
+                finally:
+                    self._release(conn)
+                logger.info("Schema info refreshed")
+            except Exception as e:
+                logger.warning(f"Schema refresh failed, keeping previous schema: {e}")
+    
+    async def _embed(self, cursor, text: str) -> Optional[np.ndarray]:
+        """Embed text with Cortex for semantic cache lookups"""
+        try:
+            row = await asyncio.to_thread(
+                self._fetchone,
+                cursor,
+                self.EMBED_STMT,
+                (self.embed_model, text)
+            )
+            vec = row[0]
+            if isinstance(vec, str):
+                vec = _json_loads(vec)
+            return SemanticCache.normalize(vec)
+        except Exception as e:
+            logger.warning(f"Embedding failed, skipping semantic cache: {e}")
+            return None
+    
+    async def query_with_cortex(self, user_question: str) -> Dict:
+        """Answer a question, sharing one backend run between identical in-flight questions"""
+        key = hashlib.sha1(user_question.strip().lower().encode()).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._query_with_cortex(user_question))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight query: {user_question}")
+        
+        # Shield so one caller giving up doesn't cancel the run for the others
+        return await asyncio.shield(task)
+    
+    async def _query_with_cortex(self, user_question: str) -> Dict:
         """Use Cortex to generate SQL, execute, and format answer"""
-        cursor = self.conn.cursor()
+        use_cache = True
+        if user_question.lower().startswith(NO_CACHE_PREFIX):
+            user_question = user_question[len(NO_CACHE_PREFIX):].strip()
+            use_cache = False
+        
+        conn = await self._acquire()
+        try:
+            try:
+                return await self._answer(conn, user_question, use_cache)
+            except snowflake.connector.errors.OperationalError as e:
+                # Dropped session (idle timeout, network blip): reconnect once and retry
+                logger.warning(f"Snowflake connection lost ({e}), reconnecting")
+                self._discard(conn)
+                conn = None
+                conn = await asyncio.to_thread(self._connect)
+                return await self._answer(conn, user_question, use_cache)
+        except Exception as e:
+            logger.error(f"Error querying with Cortex: {e}")
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn)
+    
+    async def _answer(self, conn, user_question: str, use_cache: bool) -> Dict:
+        """Generate SQL, execute it, and format the answer on one connection"""
+        cursor = conn.cursor()
+        gen_cursor = conn.cursor()
         
         try:
-            # Step 1: Generate SQL using Cortex
-            logger.info(f"Generating SQL for: {user_question}")
+            # Exact repeats of a question reuse the SQL generated last time
+            sql_key = GeneratedSqlCache.key(self.model, user_question)
+            schema_sha1 = hashlib.sha1(self.schema_info.encode()).hexdigest()
+            stored_sql = None
+            if self.sql_cache and use_cache:
+                stored_sql = self.sql_cache.get(sql_key, schema_sha1)
+            
+            # Answer from the semantic cache if a similar question was asked recently;
+            # this runs before generation so a hit never starts a Cortex COMPLETE
+            question_vec = None
+            if self.cache and use_cache:
+                question_vec = await self._embed(cursor, user_question)
+                if question_vec is not None:
+                    cached = self.cache.lookup(question_vec, self.model, schema_sha1)
+                    if cached:
+                        return {**cached, "cached": True}
             
-            sql_prompt = f"""You are a SQL expert analyzing a Snowflake database.
+            # Step 1: Generate SQL (stored SQL is only looked up for cacheable questions)
+            if stored_sql is not None:
+                logger.info(f"Reusing stored SQL for: {user_question}")
+                generated_sql = stored_sql
+            else:
+                logger.info(f"Generating SQL for: {user_question}")
+                
+                sql_prompt = f"""You are a SQL expert analyzing a Snowflake database.
 
 Database Schema:
 {self.schema_info}
@@ -120,20 +503,30 @@ Rules:
 
 SQL Query:"""
 
-            sql_generation = f"""
-            SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                '{self.model}',
-                '{sql_prompt.replace("'", "''")}'
-            ) as generated_sql
-            """
-            
-            cursor.execute(sql_generation)
-            generated_sql = cursor.fetchone()[0].strip()
-            
-            # Clean up the SQL (remove markdown if present)
-            if generated_sql.startswith("```"):
-                lines = generated_sql.split("\n")
-                generated_sql = "\n".join([l for l in lines if not l.startswith("```")])
+                if self.cache and not use_cache:
+                    # A no_cache question skips the lookup but still refreshes the
+                    # cache: start the generation server-side and embed meanwhile
+                    await asyncio.to_thread(
+                        gen_cursor.execute_async,
+                        self.SQL_GEN_STMT,
+                        (self.model, sql_prompt)
+                    )
+                    question_vec = await self._embed(cursor, user_question)
+                    row = await self._await_query(conn, gen_cursor, gen_cursor.sfqid)
+                else:
+                    # Nothing to overlap: a plain execute avoids status polling
+                    row = await asyncio.to_thread(
+                        self._fetchone,
+                        gen_cursor,
+                        self.SQL_GEN_STMT,
+                        (self.model, sql_prompt)
+                    )
+                generated_sql = row[0].strip()
+                
+                # Clean up the SQL (remove markdown if present)
+                if generated_sql.startswith("```"):
+                    lines = generated_sql.split("\n")
+                    generated_sql = "\n".join([l for l in lines if not l.startswith("```")])
             
             logger.info(f"Generated SQL: {generated_sql}")
             
@@ -141,179 +534,256 @@ SQL Query:"""
             if not self._is_safe_sql(generated_sql):
                 raise ValueError("Generated SQL failed safety validation")
             
-            # Step 2: Execute the generated SQL
+            # Step 2: Execute the generated SQL. This stays a separate statement from
+            # the Cortex formatting call: wrapping the generated SQL in a CTE would
+            # lose its ORDER BY (Snowflake only orders within the subquery) and
+            # OBJECT_CONSTRUCT(*) would drop NULL columns from the rows
             logger.info("Executing generated SQL")
-            cursor.execute(generated_sql)
-            
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
+            columns, results = await asyncio.to_thread(self._fetch_rows, cursor, generated_sql)
+            truncated = len(results) > MAX_RESULT_ROWS
+            results = results[:MAX_RESULT_ROWS]
             
-            # Format as list of dicts
-            results = []
-            for row in rows[:100]:  # Limit to 100 rows
-                results.append(dict(zip(columns, row)))
+            logger.info(f"Query returned {len(results)} rows" + (" (truncated)" if truncated else ""))
             
-            logger.info(f"Query returned {len(results)} rows")
+            # Step 3: Have Cortex format the answer (empty and single-value
+            # results are phrased in Python without a Cortex call)
+            if not results or (len(results) == 1 and len(columns) == 1):
+                formatted_answer = self._format_trivial(columns, results)
+            else:
+                row = await asyncio.to_thread(
+                    self._fetchone,
+                    cursor,
+                    self.ANSWER_STMT,
+                    (self.model, self._answer_prompt(user_question, results))
+                )
+                formatted_answer = row[0]
             
-            # Step 3: Use Cortex to format the answer
-            answer_prompt = f"""User asked: {user_question}
-
-Query Results ({len(results)} rows):
-{json.dumps(results, indent=2, default=str)}
-
-Provide a clear, concise answer to the user's question based on this data.
-Format numbers nicely. Use bullet points for lists.
-Be helpful and conversational."""
-
-            answer_generation = f"""
-            SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                '{self.model}',
-                '{answer_prompt.replace("'", "''")}'
-            ) as formatted_answer
-            """
-            
-            cursor.execute(answer_generation)
-            formatted_answer = cursor.fetchone()[0]
-            
-            return {
+            result = {
                 "answer": formatted_answer,
                 "sql": generated_sql,
                 "data": results,
-                "row_count": len(results)
+                "row_count": len(results),
+                "truncated": truncated
             }
             
-        except Exception as e:
-            logger.error(f"Error querying with Cortex: {e}")
-            raise
+            if self.sql_cache and stored_sql is None:
+                await asyncio.to_thread(self.sql_cache.put, sql_key, generated_sql, self.model, schema_sha1)
+            if question_vec is not None:
+                await asyncio.to_thread(self.cache.add, user_question, question_vec, result, self.model, schema_sha1)
+            
+            return result
+            
         finally:
             cursor.close()
+            gen_cursor.close()
+    
+    @staticmethod
+    def _fetch_rows(cursor, sql: str) -> Tuple[List[str], List[Dict]]:
+        """Run the generated SQL; return its column names and up to MAX_RESULT_ROWS + 1 rows as dicts (blocking)"""
+        cursor.arraysize = MAX_RESULT_ROWS + 1
+        cursor.execute(sql)
+        columns = [desc[0] for desc in cursor.description]
+        return columns, [dict(zip(columns, row)) for row in cursor.fetchmany(MAX_RESULT_ROWS + 1)]
+    
+    @staticmethod
+    def _format_trivial(columns: List[str], results: List[Dict]) -> str:
+        """Phrase an empty or single-value (one row, one column) result without asking Cortex"""
+        if not results:
+            return "No rows matched your query."
+        
+        value = results[0][columns[0]]
+        if value is None:
+            return "The query returned no value."
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return f"The answer is **{value:,}**"
+        return f"{value}"
+    
+    @staticmethod
+    def _answer_prompt(user_question: str, results: List[Dict]) -> str:
+        """Prompt for the formatting call: a row sample plus numeric stats for larger results"""
+        row_count = len(results)
+        prompt = f"User asked: {user_question}\n\nQuery Results ({row_count} rows"
+        if row_count > PROMPT_SAMPLE_ROWS:
+            prompt += f", first {PROMPT_SAMPLE_ROWS} shown"
+        prompt += f"):\n{_json_dumps(results[:PROMPT_SAMPLE_ROWS])}"
+        
+        if row_count > PROMPT_SAMPLE_ROWS:
+            columns: Dict[str, List[float]] = {}
+            for row in results:
+                for name, value in row.items():
+                    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+                        columns.setdefault(name, []).append(float(value))
+            stats = {
+                name: {"min": min(v), "max": max(v), "sum": sum(v), "avg": sum(v) / len(v)}
+                for name, v in columns.items()
+            }
+            prompt += f"\nNumeric column stats over all rows: {_json_dumps(stats)}"
+        
+        return prompt + """
+
+Provide a clear, concise answer to the user's question based on this data.
+Format numbers nicely. Use bullet points for lists.
+Be helpful and conversational."""
     
     def _is_safe_sql(self, sql: str) -> bool:
         """Validate that SQL is safe to execute"""
-        sql_lower = sql.lower().strip()
+        cleaned = SQL_COMMENT_RE.sub(" ", sql).strip()
         
         # Must start with SELECT
-        if not sql_lower.startswith("select"):
-            logger.warning(f"SQL doesn't start with SELECT: {sql_lower[:50]}")
+        if not cleaned.lower().startswith("select"):
+            logger.warning(f"SQL doesn't start with SELECT: {cleaned[:50]}")
             return False
         
         # Block dangerous keywords
-        dangerous = [
-            "drop ", "delete ", "truncate ", "insert ", "update ",
-            "alter ", "create ", "grant ", "revoke ", "exec"
-        ]
-        
-        for keyword in dangerous:
-            if keyword in sql_lower:
-                logger.warning(f"Dangerous keyword '{keyword}' found in SQL")
-                return False
+        match = DANGEROUS_SQL_RE.search(cleaned)
+        if match:
+            logger.warning(f"Dangerous keyword '{match.group(0)}' found in SQL")
+            return False
         
         return True
     
     def close(self):
-        """Close Snowflake connection"""
-        if self.conn:
-            self.conn.close()
-            logger.info("Snowflake connection closed")
+        """Close all pooled Snowflake connections"""
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        logger.info("Snowflake connections closed")
 
 
 # Initialize Cortex provider
 cortex_provider = SnowflakeCortexProvider()
 
 
-@slack_app.event("app_mention")
-async def handle_mention(event, say):
-    """Handle @bot mentions"""
-    user = event["user"]
-    text = event["text"]
-    channel = event["channel"]
-    thread_ts = event.get("thread_ts", event["ts"])
-    
-    # Remove bot mention from text
-    question = text.split(">", 1)[1].strip() if ">" in text else text
-    
-    logger.info(f"Question from {user} in {channel}: {question}")
-    
-    # Send thinking message
-    await say(
-        text="🤔 Thinking...",
-        thread_ts=thread_ts
-    )
+# Strips the bot's own <@USERID> mention; narrowed to the real bot id at startup
+_MENTION_RE = re.compile(r"<@[A-Z0-9]+>\s*")
+
+# Background answer tasks (referenced so they aren't garbage-collected mid-flight)
+_background_tasks = set()
+
+# Recently seen (channel, ts) pairs, used to drop Slack's event retries
+_seen_events: "OrderedDict[tuple, None]" = OrderedDict()
+SEEN_EVENTS_MAX = 1000
+
+
+def _is_duplicate(event) -> bool:
+    """Return True if this event was already handled (Slack retry)"""
+    key = (event.get("channel"), event.get("ts"))
+    if key in _seen_events:
+        return True
+    _seen_events[key] = None
+    if len(_seen_events) > SEEN_EVENTS_MAX:
+        _seen_events.popitem(last=False)
+    return False
+
+
+async def _run_and_reply(channel: str, question: str, thread_ts: Optional[str] = None):
+    """Answer a question in the background and post the result to Slack"""
+    client = slack_app.client
     
     try:
         # Query using Cortex
-        result = await asyncio.to_thread(
-            cortex_provider.query_with_cortex,
-            question
-        )
+        result = await cortex_provider.query_with_cortex(question)
         
         # Send answer
         response = f"{result['answer']}\n\n_Query returned {result['row_count']} rows_"
+        if result.get("truncated"):
+            response += f" _(first {MAX_RESULT_ROWS} shown)_"
+        if result.get("cached"):
+            response += " _(cached answer)_"
         
-        await say(
+        await client.chat_postMessage(
+            channel=channel,
             text=response,
             thread_ts=thread_ts
         )
         
         # Optionally send SQL in thread
         if os.environ.get("SHOW_SQL", "false").lower() == "true":
-            await say(
+            await client.chat_postMessage(
+                channel=channel,
                 text=f"```sql\n{result['sql']}\n```",
                 thread_ts=thread_ts
             )
         
     except Exception as e:
         logger.error(f"Error processing question: {e}")
-        await say(
+        await client.chat_postMessage(
+            channel=channel,
             text=f"❌ Sorry, I encountered an error: {str(e)}",
             thread_ts=thread_ts
         )
 
 
+def _start_reply(channel: str, question: str, thread_ts: Optional[str] = None):
+    """Schedule _run_and_reply so the event handler can return immediately"""
+    task = asyncio.create_task(_run_and_reply(channel, question, thread_ts))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@slack_app.event("app_mention")
+async def handle_mention(event, say):
+    """Handle @bot mentions"""
+    if _is_duplicate(event):
+        return
+    
+    user = event["user"]
+    text = event["text"]
+    channel = event["channel"]
+    thread_ts = event.get("thread_ts", event["ts"])
+    
+    # Remove bot mention from text
+    question = _MENTION_RE.sub("", text, count=1).strip()
+    
+    logger.info(f"Question from {user} in {channel}: {question}")
+    
+    # Send thinking message, then answer in the background so the event is
+    # acknowledged well within Slack's 3s retry window
+    await say(
+        text="🤔 Thinking...",
+        thread_ts=thread_ts
+    )
+    _start_reply(channel, question, thread_ts)
+
+
 @slack_app.event("message")
 async def handle_message(event, say):
     """Handle DMs to the bot"""
     # Only respond to DMs (not channel messages)
     if event.get("channel_type") != "im":
         return
+    if _is_duplicate(event):
+        return
     
     question = event.get("text", "")
-    thread_ts = event.get("ts")
     
     logger.info(f"DM question: {question}")
     
     await say(text="🤔 Thinking...")
-    
-    try:
-        result = await asyncio.to_thread(
-            cortex_provider.query_with_cortex,
-            question
-        )
-        
-        response = f"{result['answer']}\n\n_Query returned {result['row_count']} rows_"
-        await say(text=response)
-        
-        if os.environ.get("SHOW_SQL", "false").lower() == "true":
-            await say(text=f"```sql\n{result['sql']}\n```")
-        
-    except Exception as e:
-        logger.error(f"Error processing DM: {e}")
-        await say(text=f"❌ Sorry, I encountered an error: {str(e)}")
+    _start_reply(event["channel"], question)
 
 
 async def main():
     """Main entry point"""
+    global _MENTION_RE
+    
     handler = AsyncSocketModeHandler(slack_app, os.environ.get("SLACK_APP_TOKEN"))
     
+    auth_response = await slack_app.client.auth_test()
+    _MENTION_RE = re.compile(rf"<@{re.escape(auth_response['user_id'])}>\s*")
+    
     logger.info("🚀 Slack bot with Snowflake Cortex starting...")
     logger.info(f"Using Cortex model: {cortex_provider.model}")
     
+    schema_refresh = asyncio.create_task(cortex_provider.refresh_schema_periodically())
+    
     try:
         await handler.start_async()
     except KeyboardInterrupt:
         logger.info("Shutting down...")
         cortex_provider.close()
+    finally:
+        schema_refresh.cancel()
 
 
 if __name__ == "__main__":
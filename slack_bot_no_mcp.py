@@ -7,14 +7,25 @@ Simpler architecture - just Slack + LLM + Database.
 """
 
 import os
+import time
 import asyncio
+import functools
+import hashlib
 import logging
-import json
+import queue
+import threading
 from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 
+try:
+    import orjson
+    _json_dumps = lambda obj: orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:  # orjson is optional - fall back to the stdlib encoder
+    import json
+    _json_dumps = lambda obj: json.dumps(obj, default=str)
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,6 +33,34 @@ logger = logging.getLogger(__name__)
 
 slack_app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
 
+# How long table/column listings are reused before re-querying information_schema
+SCHEMA_CACHE_TTL = int(os.environ.get("SCHEMA_CACHE_TTL", "3600"))
+
+
+def ttl_cache(seconds: int):
+    """Cache an async method's results per arguments for `seconds`
+    
+    Empty results aren't cached so a failed lookup is retried next time.
+    """
+    def decorator(fn):
+        cache = {}
+        
+        @functools.wraps(fn)
+        async def wrapper(*args):
+            now = time.monotonic()
+            hit = cache.get(args)
+            if hit and hit[0] > now:
+                return hit[1]
+            
+            value = await fn(*args)
+            if value:
+                cache[args] = (now + seconds, value)
+            return value
+        
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
 
 # ============================================================================
 # DATABASE FUNCTIONS - The LLM calls these
@@ -30,9 +69,33 @@ slack_app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
 class DatabaseTools:
     """Direct database access tools for the LLM"""
     
+    # Constant statement texts (values are always bound) so Snowflake can reuse
+    # the compiled metadata queries
+    TABLES_SQL = """
+        SELECT table_name 
+        FROM information_schema.tables 
+        WHERE table_schema = CURRENT_SCHEMA()
+        ORDER BY table_name
+    """
+    COLUMNS_SQL = """
+        SELECT column_name, data_type 
+        FROM information_schema.columns 
+        WHERE table_name = ?
+        AND table_schema = CURRENT_SCHEMA()
+        ORDER BY ordinal_position
+    """
+    
     def __init__(self):
         # Initialize your database connection
         import snowflake.connector
+        self._connector = snowflake.connector
+        
+        # Arrow fetches need the optional pyarrow extra
+        try:
+            import pyarrow  # noqa: F401
+            self._use_arrow = True
+        except ImportError:
+            self._use_arrow = False
         
         # Build connection parameters
         conn_params = {
@@ -41,6 +104,8 @@ class DatabaseTools:
             "warehouse": os.environ.get("SNOWFLAKE_WAREHOUSE"),
             "database": os.environ.get("SNOWFLAKE_DATABASE"),
             "schema": os.environ.get("SNOWFLAKE_SCHEMA"),
+            "client_session_keep_alive": True,
+            "paramstyle": "qmark",  # server-side binds keep COLUMNS_SQL's text constant
         }
         
         # Use password auth if provided, otherwise use externalbrowser
@@ -49,10 +114,106 @@ class DatabaseTools:
             conn_params["password"] = password
         else:
             conn_params["authenticator"] = os.environ.get("SNOWFLAKE_AUTHENTICATOR", "externalbrowser")
+        self.conn_params = conn_params
+        
+        # Connection pool shared by all users and tool calls. Connections are
+        # opened on demand up to pool_size and returned after each query.
+        self.pool_size = int(os.environ.get("SNOWFLAKE_POOL_SIZE", "4"))
+        if "authenticator" in conn_params and conn_params["authenticator"].lower() == "externalbrowser":
+            # Every extra connection would pop a browser SSO login mid-request
+            logger.info("Browser authentication: using a single pooled connection")
+            self.pool_size = 1
+        self.pool_timeout = 120
+        self.pool = queue.Queue()
+        self._connections = []
+        self._opening = 0  # connections being opened outside the lock
+        self._pool_lock = threading.Lock()
         
-        self.conn = snowflake.connector.connect(**conn_params)
+        self.pool.put(self._connect())
+    
+    def _connect(self):
+        """Open a new pooled connection"""
+        conn = self._connector.connect(**self.conn_params)
+        with self._pool_lock:
+            self._connections.append(conn)
+            count = len(self._connections)
+        logger.info(f"Snowflake connection opened ({count}/{self.pool_size})")
+        return conn
+    
+    def _get_conn(self):
+        """Borrow a connection, opening a new one if the pool isn't full yet"""
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            pass
+        
+        # Reserve a slot under the lock, but connect outside it so a slow login
+        # doesn't block other threads
+        with self._pool_lock:
+            can_open = len(self._connections) + self._opening < self.pool_size
+            if can_open:
+                self._opening += 1
+        
+        if can_open:
+            try:
+                return self._connect()
+            finally:
+                with self._pool_lock:
+                    self._opening -= 1
+        
+        return self.pool.get(timeout=self.pool_timeout)
+    
+    def _discard(self, conn):
+        """Drop a broken connection so the pool can open a replacement"""
+        with self._pool_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _run(self, sql: str, params=None) -> List[Dict]:
+        """Run a query on a pooled connection (blocking)"""
+        conn = self._get_conn()
+        try:
+            try:
+                return self._fetch(conn, sql, params)
+            except self._connector.errors.OperationalError as e:
+                # Dropped session (idle timeout, network blip): reconnect once and retry
+                logger.warning(f"Snowflake connection lost ({e}), reconnecting")
+                self._discard(conn)
+                conn = None
+                conn = self._connect()
+                return self._fetch(conn, sql, params)
+        finally:
+            if conn is not None:
+                self.pool.put(conn)
+    
+    def _fetch(self, conn, sql: str, params=None) -> List[Dict]:
+        """Execute a query and return its rows as dicts"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            
+            # Prefer the columnar Arrow result (converted to rows in C)
+            if self._use_arrow:
+                errors = self._connector.errors
+                try:
+                    table = cursor.fetch_arrow_all()
+                    return table.to_pylist() if table is not None else []
+                except (errors.MissingDependencyError, errors.NotSupportedError, errors.ProgrammingError):
+                    pass  # result not in Arrow format
+            
+            # Get column names
+            columns = [col[0] for col in cursor.description]
+            
+            # Convert to list of dicts
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
     
-    def execute_query(self, sql: str) -> List[Dict]:
+    async def execute_query(self, sql: str) -> List[Dict]:
         """
         Execute a SQL query and return results as list of dicts
         
@@ -63,56 +224,25 @@ class DatabaseTools:
             List of row dicts
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
-            
-            # Get column names
-            columns = [col[0] for col in cursor.description]
-            
-            # Fetch all rows
-            rows = cursor.fetchall()
-            
-            # Convert to list of dicts
-            results = [dict(zip(columns, row)) for row in rows]
-            
-            cursor.close()
-            return results
+            return await asyncio.to_thread(self._run, sql)
             
         except Exception as e:
             logger.error(f"Query failed: {e}")
             return [{"error": str(e)}]
     
-    def get_available_tables(self) -> List[str]:
+    @ttl_cache(SCHEMA_CACHE_TTL)
+    async def get_available_tables(self) -> List[str]:
         """Get list of available tables"""
-        sql = """
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema = CURRENT_SCHEMA()
-        ORDER BY table_name
-        """
-        results = self.execute_query(sql)
-        return [r['TABLE_NAME'] for r in results]
+        results = await self.execute_query(self.TABLES_SQL)
+        return [r['TABLE_NAME'] for r in results if 'TABLE_NAME' in r]
     
-    def get_table_columns(self, table_name: str) -> List[Dict]:
+    @ttl_cache(SCHEMA_CACHE_TTL)
+    async def get_table_columns(self, table_name: str) -> List[Dict]:
         """Get columns for a specific table"""
-        sql = """
-        SELECT column_name, data_type 
-        FROM information_schema.columns 
-        WHERE table_name = %s
-        AND table_schema = CURRENT_SCHEMA()
-        ORDER BY ordinal_position
-        """
         # Use parameterized query to prevent SQL injection
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql, (table_name.upper(),))  # Snowflake stores table names in uppercase
-            
-            columns = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            results = [dict(zip(columns, row)) for row in rows]
-            
-            cursor.close()
-            return results
+            # Snowflake stores table names in uppercase
+            return await asyncio.to_thread(self._run, self.COLUMNS_SQL, (table_name.upper(),))
         except Exception as e:
             logger.error(f"Failed to get columns for {table_name}: {e}")
             return []
@@ -122,6 +252,23 @@ class DatabaseTools:
 # LLM INTEGRATION
 # ============================================================================
 
+SYSTEM_PROMPT = """You are a data analytics assistant with direct SQL access to a Snowflake database.
+
+Database schema:
+{schema_context}
+
+When answering questions:
+1. Use the get_schema_info tool if you need more detail about a table's columns
+2. Use the execute_sql tool to query the database
+3. Format numbers nicely (e.g., $1.2B instead of 1200000000)
+4. Be concise but informative
+5. If a table has a date column, consider filtering to the most recent date unless the user asks for historical data
+"""
+
+# Schema context used when discovery fails before any schema was loaded
+SCHEMA_FALLBACK = "Schema discovery failed. Use get_schema_info tool to explore tables."
+
+
 class LLMWithDirectDB:
     """LLM that can call database functions directly"""
     
@@ -129,6 +276,45 @@ class LLMWithDirectDB:
         from anthropic import AsyncAnthropic
         self.client = AsyncAnthropic(api_key=api_key)
         self.db = DatabaseTools()
+        self._tools = self.get_tools()
+        self._system_blocks: Optional[List[Dict]] = None
+        self._schema_refresh: Optional[asyncio.Task] = None
+        
+        # Identical queries currently being answered, keyed by normalized-query hash
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    async def start(self):
+        """Load the schema context and keep it fresh in the background"""
+        self._set_schema_context(await self._build_schema_context() or SCHEMA_FALLBACK)
+        self._schema_refresh = asyncio.create_task(self._refresh_schema_periodically())
+    
+    async def _refresh_schema_periodically(self):
+        """Rebuild the schema context every SCHEMA_CACHE_TTL seconds"""
+        while True:
+            await asyncio.sleep(SCHEMA_CACHE_TTL)
+            try:
+                self.db.get_available_tables.cache_clear()
+                self.db.get_table_columns.cache_clear()
+                schema_context = await self._build_schema_context()
+                if schema_context is None:
+                    logger.warning("Schema refresh found nothing, keeping previous schema context")
+                    continue
+                self._set_schema_context(schema_context)
+                logger.info("Schema context refreshed")
+            except Exception as e:
+                logger.warning(f"Schema refresh failed, keeping previous schema context: {e}")
+    
+    def _set_schema_context(self, schema_context: str):
+        """Rebuild the system prompt blocks for a new schema context
+        
+        The system prompt only changes here, never per request, so Anthropic's
+        prompt cache keeps hitting between schema refreshes.
+        """
+        self._system_blocks = [{
+            "type": "text",
+            "text": SYSTEM_PROMPT.format(schema_context=schema_context),
+            "cache_control": {"type": "ephemeral"}
+        }]
     
     def get_tools(self) -> List[Dict]:
         """Define tools the LLM can use"""
@@ -166,16 +352,19 @@ class LLMWithDirectDB:
             }
         ]
     
-    def _build_schema_context(self) -> str:
-        """Dynamically build schema context from the database"""
+    async def _build_schema_context(self) -> Optional[str]:
+        """Dynamically build schema context from the database (None if discovery fails)"""
         try:
-            tables = self.db.get_available_tables()
+            tables = await self.db.get_available_tables()
             if not tables:
-                return "No tables found in the current schema."
+                logger.warning("No tables found in the current schema")
+                return None
 
+            tables = tables[:20]  # Limit to 20 tables to avoid huge prompts
+            table_columns = await asyncio.gather(*(self.db.get_table_columns(t) for t in tables))
+            
             schema_parts = []
-            for table in tables[:20]:  # Limit to 20 tables to avoid huge prompts
-                columns = self.db.get_table_columns(table)
+            for table, columns in zip(tables, table_columns):
                 col_list = ", ".join(
                     f"{c['COLUMN_NAME']} ({c['DATA_TYPE']})" for c in columns[:30]
                 )
@@ -184,86 +373,101 @@ class LLMWithDirectDB:
             return "\n".join(schema_parts)
         except Exception as e:
             logger.warning(f"Failed to build schema context: {e}")
-            return "Schema discovery failed. Use get_schema_info tool to explore tables."
+            return None
+
+    async def _run_tool(self, block) -> Dict:
+        """Execute one tool_use block and return its tool_result content block"""
+        tool_name = block.name
+        tool_input = block.input
+        
+        logger.info(f"LLM calling: {tool_name}")
+        
+        # Execute tool
+        if tool_name == "execute_sql":
+            sql = tool_input.get("sql")
+            logger.info(f"SQL: {sql[:100]}...")
+            tool_result = await self.db.execute_query(sql)
+            result_text = _json_dumps(tool_result)
+        
+        elif tool_name == "get_schema_info":
+            table_name = tool_input.get("table_name")
+            if table_name:
+                tool_result = await self.db.get_table_columns(table_name)
+            else:
+                tool_result = {"tables": await self.db.get_available_tables()}
+            result_text = _json_dumps(tool_result)
+        
+        else:
+            result_text = f"Unknown tool: {tool_name}"
+        
+        return {
+            "type": "tool_result",
+            "tool_use_id": block.id,
+            "content": result_text
+        }
 
     async def chat(self, query: str) -> str:
+        """Answer a query, sharing one LLM run between identical in-flight queries"""
+        key = hashlib.sha1(query.strip().lower().encode()).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._chat(query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight query: {query}")
+        
+        # Shield so one caller giving up doesn't cancel the run for the others
+        return await asyncio.shield(task)
+    
+    async def _chat(self, query: str) -> str:
         """Process a query using Claude + direct DB access"""
         try:
-            schema_context = self._build_schema_context()
-
-            system_prompt = f"""You are a data analytics assistant with direct SQL access to a Snowflake database.
-
-Database schema:
-{schema_context}
-
-When answering questions:
-1. Use the get_schema_info tool if you need more detail about a table's columns
-2. Use the execute_sql tool to query the database
-3. Format numbers nicely (e.g., $1.2B instead of 1200000000)
-4. Be concise but informative
-5. If a table has a date column, consider filtering to the most recent date unless the user asks for historical data
-"""
+            if self._system_blocks is None:
+                self._set_schema_context(await self._build_schema_context() or SCHEMA_FALLBACK)
             
             messages = [{"role": "user", "content": query}]
+            cached_block = None
             
             # Initial LLM call
             response = await self.client.messages.create(
                 model="claude-sonnet-4-5-20241022",
                 max_tokens=4096,
-                system=system_prompt,
+                system=self._system_blocks,
                 messages=messages,
-                tools=self.get_tools()
+                tools=self._tools
             )
             
             # Handle tool use
             while response.stop_reason == "tool_use":
-                # Execute tools
-                for block in response.content:
-                    if block.type == "tool_use":
-                        tool_name = block.name
-                        tool_input = block.input
-                        
-                        logger.info(f"LLM calling: {tool_name}")
-                        
-                        # Execute tool
-                        if tool_name == "execute_sql":
-                            sql = tool_input.get("sql")
-                            logger.info(f"SQL: {sql[:100]}...")
-                            tool_result = self.db.execute_query(sql)
-                            result_text = json.dumps(tool_result, default=str)
-                        
-                        elif tool_name == "get_schema_info":
-                            table_name = tool_input.get("table_name")
-                            if table_name:
-                                tool_result = self.db.get_table_columns(table_name)
-                            else:
-                                tool_result = {"tables": self.db.get_available_tables()}
-                            result_text = json.dumps(tool_result, default=str)
-                        
-                        else:
-                            result_text = f"Unknown tool: {tool_name}"
-                        
-                        # Add tool result to conversation
-                        messages.append({
-                            "role": "assistant",
-                            "content": response.content
-                        })
-                        messages.append({
-                            "role": "user",
-                            "content": [{
-                                "type": "tool_result",
-                                "tool_use_id": block.id,
-                                "content": result_text
-                            }]
-                        })
+                # Execute all tool calls from this turn concurrently
+                tool_blocks = [b for b in response.content if b.type == "tool_use"]
+                tool_results = list(await asyncio.gather(*(self._run_tool(b) for b in tool_blocks)))
+                
+                # Move the cache breakpoint to the newest tool result so the whole
+                # conversation prefix is reused on the next turn
+                if cached_block is not None:
+                    cached_block.pop("cache_control", None)
+                cached_block = tool_results[-1]
+                cached_block["cache_control"] = {"type": "ephemeral"}
+                
+                # Add tool results to conversation
+                messages.append({
+                    "role": "assistant",
+                    "content": response.content
+                })
+                messages.append({
+                    "role": "user",
+                    "content": tool_results
+                })
                 
                 # Get final response from LLM
                 response = await self.client.messages.create(
                     model="claude-sonnet-4-5-20241022",
                     max_tokens=4096,
-                    system=system_prompt,
+                    system=self._system_blocks,
                     messages=messages,
-                    tools=self.get_tools()
+                    tools=self._tools
                 )
             
             # Extract final text response
@@ -361,6 +565,7 @@ async def main():
     logger.info("=" * 60)
     
     await bot.initialize()
+    await llm.start()
     
     logger.info("✓ Database connected")
     logger.info("✓ LLM ready (Claude)")
@@ -11,14 +11,35 @@ Architecture:
 """
 
 import os
+import time
+import hashlib
 import logging
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 import anthropic
-import requests
-from typing import Dict, List, Optional
+import aiohttp
+from cachetools import TTLCache
+from json_repair import repair_json
+from pydantic import BaseModel, Field, ValidationError, ValidationInfo, field_validator
+from typing import Awaitable, Callable, Collection, Dict, List, Literal, Optional, Set, Union
 import asyncio
-import json
+from collections import OrderedDict, deque
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = lambda obj: orjson.dumps(obj).decode()
+except ImportError:  # orjson is optional - fall back to the stdlib parser
+    import json
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+# Compressed GraphQL responses; brotli is only advertised when aiohttp can decode it
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
 
 # Configure logging
 logging.basicConfig(
@@ -34,73 +55,162 @@ slack_app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
 class DBTSemanticLayerProvider:
     """dbt Cloud Semantic Layer integration"""
     
+    # Fixed GraphQL documents; per-call values travel as variables so the
+    # query text is byte-identical on every request
+    METRICS_QUERY = """
+    query Metrics($environmentId: BigInt!) {
+        metrics(environmentId: $environmentId) {
+            name
+            description
+            type
+            dimensions {
+                name
+                description
+                type
+            }
+            queryableGranularities
+        }
+    }
+    """
+    
+    QUERY_METRICS = """
+    query QueryMetrics(
+        $environmentId: BigInt!,
+        $metrics: [MetricInput!]!,
+        $groupBy: [GroupByInput!],
+        $where: [WhereInput!],
+        $orderBy: [OrderByInput!],
+        $limit: Int
+    ) {
+        query(
+            environmentId: $environmentId,
+            metrics: $metrics,
+            groupBy: $groupBy,
+            where: $where,
+            orderBy: $orderBy,
+            limit: $limit
+        ) {
+            sql
+            rows {
+                dimensions {
+                    name
+                    value
+                }
+                measures {
+                    name
+                    value
+                }
+            }
+        }
+    }
+    """
+    
     def __init__(self):
         self.service_token = os.environ.get("DBT_CLOUD_SERVICE_TOKEN")
-        self.environment_id = os.environ.get("DBT_CLOUD_ENVIRONMENT_ID")
+        environment_id = os.environ.get("DBT_CLOUD_ENVIRONMENT_ID", "")
+        if not environment_id.strip().isdigit():
+            raise ValueError(
+                f"DBT_CLOUD_ENVIRONMENT_ID must be the numeric dbt Cloud environment id, got {environment_id!r}"
+            )
+        self.environment_id = int(environment_id)
         self.base_url = "https://semantic-layer.cloud.getdbt.com/api/graphql"
+        self.metrics_catalog: List[Dict] = []
+        self._metrics_description = ""
+        self.metric_names: Set[str] = set()
+        self.catalog_hash = b""  # changes whenever a refresh returns a different catalog
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._catalog_lock = asyncio.Lock()
+        self._refresh_durations = deque(maxlen=5)  # recent catalog fetch times
+        # Cap concurrent GraphQL requests so bursts don't trip dbt's rate limits
+        self._slots = asyncio.Semaphore(int(os.environ.get("DBT_MAX_CONCURRENCY", "10")))
+        # The session is shared process-wide, so auth goes on each request
+        self._headers = {
+            "Authorization": f"Token {self.service_token}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING
+        }
+    
+    async def startup(self, session: aiohttp.ClientSession):
+        """Attach the shared HTTP session and load available metrics"""
+        self._session = session
         
-        # Load available metrics on startup
-        self.metrics_catalog = self._get_metrics_catalog()
+        # Load available metrics on startup; a failure here is retried by the
+        # background refresh instead of crashing the bot
+        try:
+            await self.refresh_catalog()
+        except Exception as e:
+            logger.error(f"Failed to load metrics catalog, will retry: {e}")
+    
+    async def refresh_catalog(self):
+        """Re-fetch the metrics catalog and its cached description"""
+        async with self._catalog_lock:
+            started = time.monotonic()
+            metrics_catalog = await self._get_metrics_catalog()
+            self._refresh_durations.append(time.monotonic() - started)
+            
+            self.metrics_catalog = metrics_catalog
+            self._metrics_description = self._build_metrics_description()
+            self.metric_names = {m["name"] for m in metrics_catalog}
+            self.catalog_hash = hashlib.blake2b(_json_dumps(metrics_catalog).encode(), digest_size=16).digest()
         logger.info(f"Loaded {len(self.metrics_catalog)} metrics from dbt Semantic Layer")
     
-    def _make_request(self, query: str) -> Dict:
+    def _refresh_interval(self) -> float:
+        """Seconds until the next catalog refresh: 10x the recent average fetch time, at least 60s"""
+        if not self._refresh_durations:
+            return 60.0
+        avg = sum(self._refresh_durations) / len(self._refresh_durations)
+        return max(60.0, 10 * avg)
+    
+    async def refresh_catalog_periodically(self):
+        """Background task: keep the metrics catalog fresh"""
+        while True:
+            await asyncio.sleep(self._refresh_interval())
+            try:
+                await self.refresh_catalog()
+            except Exception as e:
+                logger.warning(f"Catalog refresh failed, keeping previous catalog: {e}")
+    
+    async def _make_request(self, query: str, variables: Optional[Dict] = None) -> Dict:
         """Make GraphQL request to Semantic Layer"""
-        headers = {
-            "Authorization": f"Token {self.service_token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            self.base_url,
-            headers=headers,
-            json={"query": query}
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Semantic Layer API error: {response.status_code} - {response.text}")
+        payload = {"query": query, "variables": {"environmentId": self.environment_id, **(variables or {})}}
+        async with self._slots, self._session.post(self.base_url, json=payload, headers=self._headers) as response:
+            if response.status != 200:
+                raise Exception(f"Semantic Layer API error: {response.status} - {await response.text()}")
+            
+            data = _json_loads(await response.read())
         
-        data = response.json()
         if "errors" in data:
             raise Exception(f"GraphQL errors: {data['errors']}")
         
         return data.get("data", {})
     
-    def _get_metrics_catalog(self) -> List[Dict]:
+    async def _get_metrics_catalog(self) -> List[Dict]:
         """Get list of available metrics and dimensions"""
-        query = f"""
-        query {{
-            metrics(environmentId: {self.environment_id}) {{
-                name
-                description
-                type
-                dimensions {{
-                    name
-                    description
-                    type
-                }}
-                queryableGranularities
-            }}
-        }}
-        """
-        
-        result = self._make_request(query)
+        result = await self._make_request(self.METRICS_QUERY)
         return result.get("metrics", [])
     
     def get_metrics_description(self) -> str:
         """Get human-readable description of available metrics"""
-        descriptions = []
+        return self._metrics_description
+    
+    def _build_metrics_description(self) -> str:
+        """Render the metrics catalog once per load (the text is reused in every prompt)
+        
+        One compact line per metric - `- name: description | dims: d1,d2` - to
+        keep the prompt small.
+        """
+        lines = []
         for metric in self.metrics_catalog:
-            desc = f"**{metric['name']}**: {metric.get('description', 'No description')}"
+            line = f"- {metric['name']}: {(metric.get('description') or '')[:80]}"
             
             if metric.get('dimensions'):
-                dims = [d['name'] for d in metric['dimensions'][:5]]
-                desc += f"\n  Dimensions: {', '.join(dims)}"
+                line += f" | dims: {','.join(d['name'] for d in metric['dimensions'][:5])}"
             
-            descriptions.append(desc)
+            lines.append(line)
         
-        return "\n\n".join(descriptions)
+        return "\n".join(lines)
     
-    def query_metrics(
+    async def query_metrics(
         self,
         metrics: List[str],
         group_by: Optional[List[str]] = None,
@@ -110,147 +220,607 @@ class DBTSemanticLayerProvider:
     ) -> Dict:
         """Query specific metrics from Semantic Layer"""
         
-        # Build GraphQL query
-        group_by_str = json.dumps(group_by) if group_by else "[]"
-        where_str = json.dumps(where) if where else "[]"
-        order_str = json.dumps(order_by) if order_by else "[]"
-        
-        query = f"""
-        query {{
-            query(
-                environmentId: {self.environment_id},
-                metrics: {json.dumps(metrics)},
-                groupBy: {group_by_str},
-                where: {where_str},
-                orderBy: {order_str},
-                limit: {limit}
-            ) {{
-                sql
-                rows {{
-                    dimensions {{
-                        name
-                        value
-                    }}
-                    measures {{
-                        name
-                        value
-                    }}
-                }}
-            }}
-        }}
-        """
+        variables = {
+            "metrics": [{"name": m} for m in metrics],
+            "groupBy": [{"name": g} for g in group_by or []],
+            "where": [{"sql": self._where_sql(w)} for w in where or []],
+            "orderBy": [self._order_by_input(o, metrics) for o in order_by or []],
+            "limit": limit
+        }
         
         logger.info(f"Querying metrics: {metrics}")
-        result = self._make_request(query)
+        result = await self._make_request(self.QUERY_METRICS, variables)
         
         # Convert to more friendly format
         query_result = result.get("query", {})
-        rows = []
-        
-        for row in query_result.get("rows", []):
-            row_data = {}
-            
-            # Add dimensions
-            for dim in row.get("dimensions", []):
-                row_data[dim["name"]] = dim["value"]
-            
-            # Add measures
-            for measure in row.get("measures", []):
-                row_data[measure["name"]] = measure["value"]
-            
-            rows.append(row_data)
+        rows = list(self._iter_rows(query_result))
+        measures = list(dict.fromkeys(
+            m["name"] for row in query_result.get("rows", []) for m in row.get("measures", [])
+        ))
         
         return {
             "sql": query_result.get("sql"),
             "data": rows,
+            "measures": measures,
             "row_count": len(rows)
         }
-
-
-class LLMProvider:
-    """Claude integration for mapping questions to metrics"""
     
-    def __init__(self):
-        self.client = anthropic.Anthropic(
-            api_key=os.environ.get("ANTHROPIC_API_KEY")
-        )
-        self.model = os.environ.get("LLM_MODEL", "claude-sonnet-4-5-20241022")
+    @staticmethod
+    def _where_sql(condition: Dict) -> str:
+        """Turn a {dimension, operator, value} filter into a Semantic Layer where clause"""
+        value = condition.get("value")
+        if isinstance(value, str):
+            value = "'" + value.replace("'", "''") + "'"
+        return f"{{{{ Dimension('{condition['dimension']}') }}}} {condition['operator']} {value}"
     
-    async def map_question_to_metrics(
-        self,
-        question: str,
-        metrics_catalog: str
-    ) -> Dict:
-        """Map user question to semantic layer metric query"""
-        
-        prompt = f"""You are a data analyst helping map user questions to dbt Semantic Layer metrics.
+    @staticmethod
+    def _order_by_input(order: str, metrics: List[str]) -> Dict:
+        """Turn "name [ASC|DESC]" into an OrderByInput for a metric or dimension"""
+        name, _, direction = order.partition(" ")
+        target = {"metric": {"name": name}} if name in metrics else {"groupBy": {"name": name}}
+        return {**target, "descending": direction.strip().upper() == "DESC"}
+    
+    @staticmethod
+    def _iter_rows(query_result: Dict):
+        """Yield each result row as a flat {name: value} dict of dimensions then measures"""
+        for row in query_result.get("rows", []):
+            row_data = {d["name"]: d["value"] for d in row.get("dimensions", [])}
+            row_data.update({m["name"]: m["value"] for m in row.get("measures", [])})
+            yield row_data
 
-Available Metrics:
-{metrics_catalog}
 
-User Question: {question}
+# Static instructions live in cache_control system blocks so Anthropic's prompt
+# cache can reuse them (and the metrics catalog) across questions
+MAPPING_INSTRUCTIONS = """You are a data analyst helping map user questions to dbt Semantic Layer metrics.
 
 Determine which metrics to query and how to query them. Return a JSON object with:
-{{
+{
     "metrics": ["metric_name1", "metric_name2"],
     "group_by": ["dimension1", "dimension2"],  // optional
-    "where": [{{"dimension": "sector", "operator": "=", "value": "SaaS"}}],  // optional
+    "where": [{"dimension": "sector", "operator": "=", "value": "SaaS"}],  // optional
     "order_by": ["metric_name1 DESC"],  // optional
     "limit": 100,
     "explanation": "Brief explanation of what you're querying"
-}}
+}
 
 If the question can't be answered with available metrics, return:
-{{
+{
     "error": "Cannot answer - explain why"
-}}
+}
 
 Return ONLY valid JSON, no other text."""
 
-        message = await asyncio.to_thread(
-            self.client.messages.create,
-            model=self.model,
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
+# Minimum seconds between Slack edits while an answer streams in
+# (chat.update is rate limited to roughly one call a second)
+STREAM_UPDATE_INTERVAL = 1.2
+
+# Too short to meet Anthropic's minimum cacheable prompt length, so not marked
+# for prompt caching
+FORMAT_SYSTEM = """You are a helpful data analyst. Format the data you are given into a clear answer to the user's question.
+
+Max 120 words. No intro or closing remarks - start with the answer.
+Use a short bullet list for multiple values.
+Format numbers nicely (e.g., $1.2M instead of 1234567)."""
+
+
+def _prepare_rows_for_llm(rows: List[Dict], k: int = 20, max_chars: int = 40) -> Dict:
+    """Shrink a result for the formatting prompt: the first k rows with long
+    strings truncated, plus sum/mean/min/max of each numeric column over all
+    rows when some were left out"""
+    prepared = {
+        "rows": [
+            {name: value[:max_chars] if isinstance(value, str) else value for name, value in row.items()}
+            for row in rows[:k]
+        ],
+        "omitted": max(0, len(rows) - k)
+    }
+    if not prepared["omitted"]:
+        return prepared
+    
+    columns: Dict[str, List[float]] = {}
+    for row in rows:
+        for name, value in row.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                columns.setdefault(name, []).append(value)
+    
+    prepared["numeric_summary"] = {
+        name: {"sum": sum(values), "mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+        for name, values in columns.items()
+    }
+    return prepared
+
+
+class WhereFilter(BaseModel):
+    """One filter in a query plan; rendered into a Semantic Layer where clause"""
+    
+    dimension: str = Field(pattern=r"^\w+$")
+    operator: Literal["=", "!=", "<>", ">", ">=", "<", "<=", "LIKE", "ILIKE"] = "="
+    value: Union[bool, int, float, str]
+
+
+class Plan(BaseModel):
+    """A metric query plan returned by the mapping model"""
+    
+    metrics: List[str] = Field(min_length=1)
+    group_by: Optional[List[str]] = None
+    where: Optional[List[WhereFilter]] = None
+    order_by: Optional[List[str]] = None
+    limit: int = 100
+    explanation: str = ""
+    
+    @field_validator("metrics")
+    @classmethod
+    def known_metrics(cls, metrics: List[str], info: ValidationInfo) -> List[str]:
+        """Reject metric names that aren't in the catalog"""
+        known = (info.context or {}).get("metric_names")
+        unknown = [m for m in metrics if known and m not in known]
+        if unknown:
+            raise ValueError(f"unknown metrics {unknown}")
+        return metrics
+
+
+async def _best_effort_update(on_update: Callable[[str], Awaitable[None]], text: str):
+    """Run one streamed edit; a failed partial edit is logged, never raised"""
+    try:
+        await on_update(text)
+    except Exception as e:
+        logger.warning(f"Partial answer update failed: {e}")
+
+
+class LLMProvider:
+    """Claude integration for mapping questions to metrics"""
+    
+    def __init__(self):
+        self.client = anthropic.AsyncAnthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY")
         )
+        self.model = os.environ.get("LLM_MODEL", "claude-sonnet-4-5-20241022")
+        # Mapping is tried on the small model first and falls back to the main one
+        self.model_small = os.environ.get("LLM_MODEL_SMALL", "claude-3-5-haiku-20241022")
+        self.model_large = self.model
+        self._mapping_system_cache = None
+        # Cap concurrent Claude calls
+        self._slots = asyncio.Semaphore(int(os.environ.get("LLM_MAX_CONCURRENCY", "20")))
+    
+    async def map_question_to_metrics(
+        self,
+        question: str,
+        metrics_catalog: str,
+        metric_names: Optional[Set[str]] = None
+    ) -> Dict:
+        """Map user question to semantic layer metric query"""
+        messages = [{"role": "user", "content": f"User Question: {question}"}]
+        
+        # Small model first; any unusable or error reply goes to the main model
+        if self.model_small != self.model_large:
+            content = await self._complete_mapping(self.model_small, metrics_catalog, messages)
+            try:
+                plan = self.parse_plan(content, metric_names)
+                if "error" not in plan:
+                    return plan
+            except ValueError:
+                pass
+            logger.info(f"{self.model_small} gave no usable plan, retrying with {self.model_large}")
+        
+        content = await self._complete_mapping(self.model_large, metrics_catalog, messages)
+        try:
+            return self.parse_plan(content, metric_names)
+        except ValueError as e:
+            # One terse correction round instead of failing the whole request
+            logger.info(f"Invalid plan, asking for a correction: {e}")
+            messages = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"That plan is invalid: {e}\nReturn ONLY the corrected JSON."}
+            ]
+            content = await self._complete_mapping(self.model_large, metrics_catalog, messages)
+            return self.parse_plan(content, metric_names)
+    
+    async def _complete_mapping(self, model: str, metrics_catalog: str, messages: List[Dict]) -> str:
+        """Run one mapping completion and return its text"""
+        async with self._slots:
+            message = await self.client.messages.create(
+                model=model,
+                max_tokens=2000,
+                system=self._mapping_system(metrics_catalog),
+                messages=messages
+            )
+        return message.content[0].text
+    
+    @staticmethod
+    def parse_plan(content, metric_names: Optional[Set[str]] = None) -> Dict:
+        """
+        Parse (repairing malformed JSON) and validate a mapping reply
+        
+        Returns a validated plan, or an {"error": ...} reply as-is; raises
+        ValueError for anything else, including unknown metric names.
+        """
+        data = repair_json(content, return_objects=True) if isinstance(content, str) else content
+        if isinstance(data, dict) and "error" in data:
+            return data
         
-        content = message.content[0].text
-        return json.loads(content)
+        try:
+            plan = Plan.model_validate(data, context={"metric_names": metric_names})
+        except ValidationError as e:
+            raise ValueError(f"{e.error_count()} problem(s): {e.errors()[0]['msg']}") from e
+        return plan.model_dump(exclude_none=True)
+    
+    async def map_questions_batch(
+        self,
+        questions: List[str],
+        metrics_catalog: str
+    ) -> List[Dict]:
+        """Map several independent questions to metric queries in one small-model call
+        
+        Plans are returned unvalidated; callers re-map unusable ones individually.
+        """
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+        prompt = f"""Map each of these independent user questions separately.
+
+User Questions:
+{numbered}
+
+Return ONLY a JSON array with exactly {len(questions)} objects, one per question in the same order."""
+        
+        async with self._slots:
+            message = await self.client.messages.create(
+                model=self.model_small,
+                max_tokens=min(2000 * len(questions), 8000),
+                system=self._mapping_system(metrics_catalog),
+                messages=[{"role": "user", "content": prompt}]
+            )
+        
+        plans = _json_loads(message.content[0].text)
+        if not isinstance(plans, list) or len(plans) != len(questions):
+            raise ValueError(f"Expected {len(questions)} plans, got {plans!r:.200}")
+        return plans
+    
+    def _mapping_system(self, metrics_catalog: str) -> List[Dict]:
+        """System blocks for metric mapping, rebuilt only when the catalog changes"""
+        if self._mapping_system_cache is None or self._mapping_system_cache[0] != metrics_catalog:
+            self._mapping_system_cache = (metrics_catalog, [{
+                "type": "text",
+                "text": MAPPING_INSTRUCTIONS + "\n\nAvailable Metrics (one per line: `- name: description | dims: d1,d2`):\n" + metrics_catalog,
+                "cache_control": {"type": "ephemeral"}
+            }])
+        return self._mapping_system_cache[1]
     
     async def format_answer(
         self,
         question: str,
         query_plan: Dict,
-        data: List[Dict]
+        data: List[Dict],
+        on_update: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> str:
-        """Format metric query results into natural language answer"""
+        """
+        Format metric query results into natural language answer
         
-        prompt = f"""You are a helpful data analyst. Format this data into a clear answer.
-
-User Question: {question}
+        The answer is streamed; on_update, if given, receives the text so far
+        at most every STREAM_UPDATE_INTERVAL seconds.
+        """
+        
+        prompt = f"""User Question: {question}
 
 Query Details: {query_plan.get('explanation', 'N/A')}
 
 Data ({len(data)} rows):
-{json.dumps(data, indent=2, default=str)}
+{_json_dumps(_prepare_rows_for_llm(data))}"""
+
+        loop = asyncio.get_running_loop()
+        last_update = loop.time()
+        chunks = []
+        # Slack edits run as their own task (one at a time) so a slow
+        # chat_update never holds an LLM slot
+        pending_update: Optional[asyncio.Task] = None
+        
+        try:
+            async with self._slots, self.client.messages.stream(
+                model=self.model,
+                max_tokens=400,
+                system=FORMAT_SYSTEM,
+                messages=[{"role": "user", "content": prompt}]
+            ) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    if (
+                        on_update
+                        and loop.time() - last_update >= STREAM_UPDATE_INTERVAL
+                        and (pending_update is None or pending_update.done())
+                    ):
+                        last_update = loop.time()
+                        pending_update = asyncio.create_task(
+                            _best_effort_update(on_update, "".join(chunks))
+                        )
+            
+            # Let the last partial edit land before the caller posts the final text
+            if pending_update is not None:
+                await pending_update
+        finally:
+            # On an error or timeout, don't leave an edit racing the caller's message
+            if pending_update is not None and not pending_update.done():
+                pending_update.cancel()
+        
+        return "".join(chunks)
 
-Provide a clear, concise answer. Use bullet points or tables where appropriate.
-Format numbers nicely (e.g., $1.2M instead of 1234567).
-Be conversational and helpful."""
 
-        message = await asyncio.to_thread(
-            self.client.messages.create,
-            model=self.model,
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+class BatchingLLMClient:
+    """
+    Coalesces concurrent metric-mapping requests into one Claude call
+    
+    Questions arriving within batch_interval of each other (up to max_batch_size)
+    are mapped together; a lone question uses the normal single-question call.
+    Only mapping is batched - answers are formatted per request so users never
+    share context.
+    """
+    
+    def __init__(self, llm: LLMProvider, batch_interval: float = 0.015, max_batch_size: int = 8):
+        self.llm = llm
+        self.batch_interval = batch_interval
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._tasks = set()  # in-flight batches, referenced until done
+    
+    async def submit(self, question: str, metrics_catalog: str, metric_names: Optional[Set[str]] = None) -> Dict:
+        """Map a question to a query plan, possibly batched with others"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
         
-        return message.content[0].text
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, metrics_catalog, metric_names, future))
+        return await future
+    
+    async def _run(self):
+        """Worker: collect a batch, map it, resolve each caller's future"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # A catalog refresh mid-window can split a batch by catalog text
+            groups: Dict[str, List] = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for metrics_catalog, items in groups.items():
+                task = asyncio.create_task(self._map(items, metrics_catalog))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+    
+    async def _map(self, items: List, metrics_catalog: str):
+        """Map one batch; questions without a usable batched plan are mapped individually"""
+        metric_names = items[0][2]
+        pending = items
+        if len(items) > 1:
+            try:
+                plans = await self.llm.map_questions_batch([item[0] for item in items], metrics_catalog)
+                pending = []
+                for item, plan in zip(items, plans):
+                    try:
+                        plan = self.llm.parse_plan(plan, metric_names)
+                    except ValueError:
+                        plan = None
+                    if plan is None or "error" in plan:
+                        pending.append(item)
+                    elif not item[3].done():
+                        item[3].set_result(plan)
+                logger.info(f"Mapped {len(items) - len(pending)}/{len(items)} questions in one batch")
+            except Exception as e:
+                logger.warning(f"Batched mapping failed, mapping individually: {e}")
+        
+        results = await asyncio.gather(
+            *(self.llm.map_question_to_metrics(item[0], metrics_catalog, metric_names) for item in pending),
+            return_exceptions=True
+        )
+        for (_, _, _, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
 
 
 # Initialize providers
 semantic_layer = DBTSemanticLayerProvider()
 llm = LLMProvider()
+planner = BatchingLLMClient(llm)
+
+# Last query plan per conversation, used to speculatively re-run follow-ups
+_last_plans: "OrderedDict[str, Dict]" = OrderedDict()
+LAST_PLANS_MAX = 500
+
+
+def _query_args(plan: Dict) -> Dict:
+    """query_metrics keyword arguments for a query plan"""
+    return {
+        "metrics": plan["metrics"],
+        "group_by": plan.get("group_by"),
+        "where": plan.get("where"),
+        "order_by": plan.get("order_by"),
+        "limit": plan.get("limit", 100)
+    }
+
+
+async def plan_and_query(question: str, conversation: str):
+    """
+    Map a question to metrics and query them
+    
+    While Claude maps the question, the previous plan from the same conversation
+    is re-queried speculatively; follow-ups that reuse it skip a round-trip.
+    Returns (query_plan, result); result is None when the plan is an error.
+    """
+    last_plan = _last_plans.get(conversation)
+    spec_task = None
+    if last_plan is not None:
+        spec_task = asyncio.create_task(semantic_layer.query_metrics(**_query_args(last_plan)))
+        # Mark a failure as retrieved even when the plan changes and the task
+        # is never awaited (cancel() does nothing to a task that already failed)
+        spec_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    # The speculative query is always cancelled on the way out, including when
+    # the caller times out; cancelling a finished task is a no-op
+    try:
+        query_plan = await planner.submit(
+            question, semantic_layer.get_metrics_description(), semantic_layer.metric_names
+        )
+        
+        if "error" in query_plan:
+            return query_plan, None
+        
+        logger.info(f"Query plan: {query_plan}")
+        _last_plans[conversation] = query_plan
+        _last_plans.move_to_end(conversation)
+        if len(_last_plans) > LAST_PLANS_MAX:
+            _last_plans.popitem(last=False)
+        
+        query_args = _query_args(query_plan)
+        if spec_task is not None and query_args == _query_args(last_plan):
+            try:
+                result = await spec_task
+                logger.info("Reused speculative metrics query")
+                return query_plan, result
+            except Exception as e:
+                logger.warning(f"Speculative query failed, re-running: {e}")
+        
+        return query_plan, await semantic_layer.query_metrics(**query_args)
+    finally:
+        if spec_task is not None:
+            spec_task.cancel()
+
+
+# Results this small are rendered directly instead of asking Claude to format them
+SMALL_RESULT_ROWS = 5
+SMALL_RESULT_COLUMNS = 3
+
+
+def _format_value(value) -> str:
+    """Deterministic, human-friendly rendering of a single value"""
+    if isinstance(value, bool) or value is None:
+        return "-" if value is None else str(value)
+    if isinstance(value, (int, float)):
+        for threshold, suffix in ((1e9, "B"), (1e6, "M")):
+            if abs(value) >= threshold:
+                return f"{value / threshold:.1f}{suffix}"
+        return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+    return str(value)
+
+
+def _format_small_result(rows: List[Dict], measures: Collection[str] = ()) -> Optional[str]:
+    """
+    Render a small, flat result as Slack text, or None if it needs the LLM
+    
+    Only measure columns get number formatting; dimensions (years, ids) are
+    printed as-is.
+    """
+    if len(rows) > SMALL_RESULT_ROWS:
+        return None
+    if not rows:
+        return "No data matched your question."
+    
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    if len(columns) > SMALL_RESULT_COLUMNS:
+        return None
+    if any(not isinstance(v, (str, int, float, bool, type(None))) for row in rows for v in row.values()):
+        return None
+    
+    def cell(column: str, value) -> str:
+        if column in measures:
+            return _format_value(value)
+        return "-" if value is None else str(value)
+    
+    # Single value: just say it
+    if len(rows) == 1 and len(columns) == 1:
+        return f"*{columns[0]}*: {cell(columns[0], rows[0][columns[0]])}"
+    
+    table = [columns] + [[cell(c, row.get(c)) for c in columns] for row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+    lines = ["  ".join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip() for r in table]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+# Finished answers, keyed by normalized question + catalog version
+_answer_cache = TTLCache(maxsize=1024, ttl=int(os.environ.get("ANSWER_CACHE_TTL", "600")))
+
+
+def _answer_key(question: str) -> str:
+    """Cache key for a question against the current metrics catalog"""
+    normalized = " ".join(question.lower().split()).encode()
+    return hashlib.blake2b(normalized + semantic_layer.catalog_hash, digest_size=16).hexdigest()
+
+
+async def answer_question(
+    question: str,
+    conversation: str,
+    on_update: Optional[Callable[[str], Awaitable[None]]] = None
+):
+    """
+    Run the full pipeline for a question, serving repeats from the answer cache
+    
+    Returns (query_plan, result, answer); result and answer are None when the
+    plan is an error.
+    """
+    key = _answer_key(question)
+    cached = _answer_cache.get(key)
+    if cached:
+        logger.info("Answer cache hit")
+        return cached
+    
+    query_plan, result = await plan_and_query(question, conversation)
+    if "error" in query_plan:
+        return query_plan, None, None
+    
+    answer = _format_small_result(result["data"], result.get("measures", ()))
+    if answer is None:
+        answer = await llm.format_answer(question, query_plan, result["data"], on_update=on_update)
+    _answer_cache[key] = (query_plan, result, answer)
+    return query_plan, result, answer
+
+
+# Admission control: past this many in-flight questions new ones are turned
+# away, and every answer has a deadline
+MAX_IN_FLIGHT = int(os.environ.get("MAX_PENDING_QUESTIONS", "50"))
+ANSWER_TIMEOUT = float(os.environ.get("ANSWER_TIMEOUT", "30"))
+BUSY_MESSAGE = "⏳ I'm busy answering other questions right now - please try again in a minute."
+_in_flight = 0
+
+
+def _try_admit() -> bool:
+    """Reserve an in-flight slot; check and increment with no await in between"""
+    global _in_flight
+    if _in_flight >= MAX_IN_FLIGHT:
+        return False
+    _in_flight += 1
+    return True
+
+
+def _release():
+    """Give back a slot taken by _try_admit"""
+    global _in_flight
+    _in_flight -= 1
+
+
+async def answer_with_deadline(
+    question: str,
+    conversation: str,
+    on_update: Optional[Callable[[str], Awaitable[None]]] = None
+):
+    """answer_question, bounded by ANSWER_TIMEOUT"""
+    return await asyncio.wait_for(answer_question(question, conversation, on_update), timeout=ANSWER_TIMEOUT)
+
+
+def _message_updater(channel: str, ts: str) -> Callable[[str], Awaitable[None]]:
+    """Return a callback that replaces the text of an existing Slack message"""
+    async def update(text: str):
+        await slack_app.client.chat_update(channel=channel, ts=ts, text=text)
+    return update
 
 
 @slack_app.event("app_mention")
@@ -266,60 +836,47 @@ async def handle_mention(event, say):
     
     logger.info(f"Question from {user} in {channel}: {question}")
     
-    # Send thinking message
-    await say(
-        text="🤔 Analyzing your question...",
-        thread_ts=thread_ts
-    )
+    if not _try_admit():
+        await say(text=BUSY_MESSAGE, thread_ts=thread_ts)
+        return
     
     try:
-        # Step 1: Map question to metrics
-        metrics_desc = semantic_layer.get_metrics_description()
-        query_plan = await llm.map_question_to_metrics(question, metrics_desc)
-        
-        if "error" in query_plan:
-            await say(
-                text=f"❌ {query_plan['error']}\n\nAvailable metrics:\n{metrics_desc}",
-                thread_ts=thread_ts
-            )
-            return
-        
-        logger.info(f"Query plan: {query_plan}")
-        
-        # Step 2: Query semantic layer
-        result = await asyncio.to_thread(
-            semantic_layer.query_metrics,
-            metrics=query_plan["metrics"],
-            group_by=query_plan.get("group_by"),
-            where=query_plan.get("where"),
-            order_by=query_plan.get("order_by"),
-            limit=query_plan.get("limit", 100)
-        )
-        
-        # Step 3: Format answer
-        answer = await llm.format_answer(question, query_plan, result["data"])
-        
-        # Send answer
-        response = f"{answer}\n\n_Queried {len(query_plan['metrics'])} metric(s), returned {result['row_count']} rows_"
-        
-        await say(
-            text=response,
+        # Send thinking message (the answer is streamed into it)
+        thinking = await say(
+            text="🤔 Analyzing your question...",
             thread_ts=thread_ts
         )
+        show = _message_updater(thinking["channel"], thinking["ts"])
         
-        # Optionally send SQL
-        if os.environ.get("SHOW_SQL", "false").lower() == "true" and result.get("sql"):
-            await say(
-                text=f"```sql\n{result['sql']}\n```",
-                thread_ts=thread_ts
-            )
-        
-    except Exception as e:
-        logger.error(f"Error processing question: {e}", exc_info=True)
-        await say(
-            text=f"❌ Sorry, I encountered an error: {str(e)}",
-            thread_ts=thread_ts
-        )
+        try:
+            # Map question to metrics, query the semantic layer, and format the answer
+            query_plan, result, answer = await answer_with_deadline(question, f"{channel}:{thread_ts}", on_update=show)
+            
+            if "error" in query_plan:
+                metrics_desc = semantic_layer.get_metrics_description()
+                await show(f"❌ {query_plan['error']}\n\nAvailable metrics:\n{metrics_desc}")
+                return
+            
+            # Send answer
+            response = f"{answer}\n\n_Queried {len(query_plan['metrics'])} metric(s), returned {result['row_count']} rows_"
+            
+            await show(response)
+            
+            # Optionally send SQL
+            if os.environ.get("SHOW_SQL", "false").lower() == "true" and result.get("sql"):
+                await say(
+                    text=f"```sql\n{result['sql']}\n```",
+                    thread_ts=thread_ts
+                )
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out answering: {question}")
+            await show(BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"Error processing question: {e}", exc_info=True)
+            await show(f"❌ Sorry, I encountered an error: {str(e)}")
+    finally:
+        _release()
 
 
 @slack_app.event("message")
@@ -333,35 +890,35 @@ async def handle_message(event, say):
     
     logger.info(f"DM question: {question}")
     
-    await say(text="🤔 Analyzing your question...")
+    if not _try_admit():
+        await say(text=BUSY_MESSAGE)
+        return
     
     try:
-        metrics_desc = semantic_layer.get_metrics_description()
-        query_plan = await llm.map_question_to_metrics(question, metrics_desc)
-        
-        if "error" in query_plan:
-            await say(text=f"❌ {query_plan['error']}")
-            return
-        
-        result = await asyncio.to_thread(
-            semantic_layer.query_metrics,
-            metrics=query_plan["metrics"],
-            group_by=query_plan.get("group_by"),
-            where=query_plan.get("where"),
-            order_by=query_plan.get("order_by"),
-            limit=query_plan.get("limit", 100)
-        )
-        
-        answer = await llm.format_answer(question, query_plan, result["data"])
-        
-        await say(text=f"{answer}\n\n_Queried {len(query_plan['metrics'])} metric(s)_")
-        
-        if os.environ.get("SHOW_SQL", "false").lower() == "true" and result.get("sql"):
-            await say(text=f"```sql\n{result['sql']}\n```")
+        thinking = await say(text="🤔 Analyzing your question...")
+        show = _message_updater(thinking["channel"], thinking["ts"])
         
-    except Exception as e:
-        logger.error(f"Error processing DM: {e}", exc_info=True)
-        await say(text=f"❌ Sorry, I encountered an error: {str(e)}")
+        try:
+            # DMs have no threads; follow-ups are consecutive messages in the channel
+            query_plan, result, answer = await answer_with_deadline(question, event["channel"], on_update=show)
+            
+            if "error" in query_plan:
+                await show(f"❌ {query_plan['error']}")
+                return
+            
+            await show(f"{answer}\n\n_Queried {len(query_plan['metrics'])} metric(s)_")
+            
+            if os.environ.get("SHOW_SQL", "false").lower() == "true" and result.get("sql"):
+                await say(text=f"```sql\n{result['sql']}\n```")
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out answering DM: {question}")
+            await show(BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"Error processing DM: {e}", exc_info=True)
+            await show(f"❌ Sorry, I encountered an error: {str(e)}")
+    finally:
+        _release()
 
 
 @slack_app.command("/metrics")
@@ -373,16 +930,41 @@ async def handle_metrics_command(ack, say):
     await say(f"📊 **Available Metrics:**\n\n{metrics_desc}")
 
 
+def _create_http_session() -> aiohttp.ClientSession:
+    """One pooled HTTP session for the whole process, so TLS handshakes are reused"""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, limit_per_host=30, ttl_dns_cache=300, keepalive_timeout=75),
+        json_serialize=_json_dumps,
+        auto_decompress=True
+    )
+
+
 async def main():
     """Main entry point"""
+    http_session = _create_http_session()
+    # Slack Web API calls share the same connection pool
+    slack_app.client.session = http_session
     handler = AsyncSocketModeHandler(slack_app, os.environ.get("SLACK_APP_TOKEN"))
     
     logger.info("🚀 Slack bot with dbt Semantic Layer starting...")
+    await semantic_layer.startup(http_session)
     logger.info(f"Loaded {len(semantic_layer.metrics_catalog)} metrics")
     
-    await handler.start_async()
+    catalog_refresh = asyncio.create_task(semantic_layer.refresh_catalog_periodically())
+    
+    try:
+        await handler.start_async()
+    finally:
+        catalog_refresh.cancel()
+        await http_session.close()
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:  # uvloop is optional (and unavailable on Windows)
+        pass
+    
     asyncio.run(main())
 